@@ -0,0 +1,72 @@
+import time
+from pathlib import Path
+
+import lxml.html
+import typer
+from bs4 import BeautifulSoup
+from scrapy.http import HtmlResponse
+
+from scp_crawler.spiders.scp import DOMAIN, clean_content, clean_content_soup
+
+FIXTURES = Path(__file__).parent / "fixtures" / "pages"
+
+cli = typer.Typer()
+
+
+def load_pages():
+    return [(path.stem, path.read_bytes()) for path in sorted(FIXTURES.glob("*.html"))]
+
+
+def get_response(link, body):
+    return HtmlResponse(url=f"https://{DOMAIN}/{link}", body=body, encoding="utf-8")
+
+
+def extract_soup(response):
+    # The old path- serialize `#page-content` and parse it a second time with BeautifulSoup.
+    content = response.css("#page-content").get()
+    return str(clean_content_soup(BeautifulSoup(content, "lxml")))
+
+
+def extract_lxml(response):
+    return clean_content(response)
+
+
+def normalize(html):
+    # Reserialize with sorted attributes, since the two paths are free to order them differently.
+    root = lxml.html.fromstring(html)
+    for element in root.iter():
+        attributes = sorted(element.attrib.items())
+        element.attrib.clear()
+        element.attrib.update(attributes)
+    return lxml.html.tostring(root, encoding="unicode")
+
+
+def measure(extract, pages, rounds):
+    # Each round builds fresh responses so the cost of parsing the page is counted for both paths.
+    start = time.process_time()
+    for _ in range(rounds):
+        for link, body in pages:
+            extract(get_response(link, body))
+    return (len(pages) * rounds) / (time.process_time() - start)
+
+
+@cli.command()
+def run(rounds: int = 20):
+    pages = load_pages()
+    if not pages:
+        raise typer.Exit(f"No fixtures found in {FIXTURES}")
+
+    for link, body in pages:
+        if normalize(extract_soup(get_response(link, body))) != normalize(extract_lxml(get_response(link, body))):
+            print(f"Warning: extraction paths disagree on {link}")
+
+    soup_rate = measure(extract_soup, pages, rounds)
+    lxml_rate = measure(extract_lxml, pages, rounds)
+    print(f"{len(pages)} fixtures, {rounds} rounds")
+    print(f"  beautifulsoup {soup_rate:10.1f} pages/sec/core")
+    print(f"  lxml          {lxml_rate:10.1f} pages/sec/core")
+    print(f"  speedup       {lxml_rate / soup_rate:10.2f}x")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,203 @@
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlparse
+
+from scrapy import signals
+
+DOMAIN = "scp-wiki.wikidot.com"
+
+
+class Corpus:
+    # A recorded copy of the wiki on disk.
+    #
+    #   pages/<quoted path>.html      - page GETs, keyed by path
+    #   ajax/<module>/<page id>.json  - ajax-module-connector.php responses, keyed by module group and page id
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def page_path(self, path):
+        return self.root / "pages" / f"{quote(path.strip('/'), safe='') or 'index'}.html"
+
+    def ajax_path(self, module, page_id):
+        return self.root / "ajax" / module / f"{page_id}.json"
+
+    def get_ajax_key(self, form):
+        # `history/PageRevisionListModule` is stored as `history`, and so on.
+        return form.get("moduleName", "").split("/")[0], form.get("page_id", form.get("page", "0"))
+
+    def save_page(self, path, body):
+        self.save(self.page_path(path), body)
+
+    def save_ajax(self, module, page_id, response):
+        self.save(self.ajax_path(module, page_id), json.dumps(response))
+
+    def save(self, path, body):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        mode = "wb" if isinstance(body, bytes) else "w"
+        with open(path, mode) as fs:
+            fs.write(body)
+
+    def lookup(self, method, path, body=b""):
+        # Returns `(kind, file path)` for a request, where kind is used to group request counts.
+        if path.endswith("ajax-module-connector.php"):
+            form = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+            module, page_id = self.get_ajax_key(form)
+            return f"ajax:{module}", self.ajax_path(module, page_id)
+        if "system:page-tags" in path:
+            return "tag-listing", self.page_path(path)
+        return "page", self.page_path(path)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.replay(b"")
+
+    def do_POST(self):
+        self.replay(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+    def replay(self, body):
+        # Requests come in either proxy style (`GET http://scp-wiki.wikidot.com/scp-173`) or directly.
+        path = urlparse(self.path).path
+        kind, filename = self.server.corpus.lookup(self.command, path, body)
+        with self.server.lock:
+            self.server.requests[kind] += 1
+
+        if filename.exists():
+            status = 200
+            content = filename.read_bytes()
+            content_type = "application/json" if filename.suffix == ".json" else "text/html; charset=utf-8"
+        else:
+            with self.server.lock:
+                self.server.requests["missing"] += 1
+            status = 404
+            content = b"Not Found"
+            content_type = "text/plain"
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, corpus, port=0):
+        super().__init__(("127.0.0.1", port), ReplayHandler)
+        self.corpus = corpus
+        self.lock = threading.Lock()
+        self.requests = Counter()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def reset(self):
+        with self.lock:
+            counts = dict(self.requests)
+            self.requests.clear()
+        return counts
+
+
+class ReplayProxyMiddleware:
+    # Downloader middleware that sends every request for the wiki through the replay server. HTTPS requests are
+    # downgraded to HTTP, as the replay server is a plain HTTP proxy.
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.get("REPLAY_PROXY"))
+
+    def process_request(self, request):
+        if request.url.startswith("https://"):
+            return request.replace(url="http://" + request.url[len("https://") :])
+        if request.url.startswith("http://") and "proxy" not in request.meta:
+            request.meta["proxy"] = self.proxy
+        return None
+
+
+class RecordingMiddleware:
+    # Downloader middleware that saves every successful wiki response into a corpus while crawling the live site.
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(Corpus(crawler.settings.get("RECORD_CORPUS")))
+
+    def process_response(self, request, response):
+        if response.status == 200:
+            kind, filename = self.corpus.lookup(request.method, urlparse(request.url).path, request.body)
+            self.corpus.save(filename, response.body)
+        return response
+
+
+class CallbackProfiler:
+    # Spider middleware that adds up the CPU time spent in each spider callback and writes it out as JSON when
+    # the spider closes. It should sit closest to the spider so other middleware isn't counted.
+
+    def __init__(self, crawler, path):
+        self.crawler = crawler
+        self.path = path
+        self.cpu = defaultdict(float)
+        self.calls = Counter()
+        self.started = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        profiler = cls(crawler, crawler.settings.get("CALLBACK_PROFILE"))
+        crawler.signals.connect(profiler.spider_closed, signal=signals.spider_closed)
+        return profiler
+
+    def get_callback_name(self, response):
+        spider = self.crawler.spider
+        callback = response.request.callback
+        rule = response.meta.get("rule")
+        if rule is not None and getattr(callback, "__name__", None) == "_callback":
+            # CrawlSpider routes rule matches through one internal callback.
+            return spider._rules[rule].callback.__name__ if spider._rules[rule].callback else "follow"
+        return getattr(callback, "__name__", "parse")
+
+    def process_spider_input(self, response):
+        self.started[id(response)] = time.process_time()
+
+    async def process_spider_output(self, response, result):
+        # Generator callbacks only run while their output is consumed, so time each step of the iteration too.
+        cpu = time.process_time() - self.started.pop(id(response), time.process_time())
+        iterator = aiter(result)
+        name = self.get_callback_name(response)
+        self.calls[name] += 1
+        while True:
+            start = time.process_time()
+            try:
+                output = await anext(iterator)
+            except StopAsyncIteration:
+                self.cpu[name] += cpu + time.process_time() - start
+                return
+            cpu += time.process_time() - start
+            yield output
+
+    def spider_closed(self):
+        if not self.path:
+            return
+        profile = {name: {"calls": self.calls[name], "cpu": self.cpu[name]} for name in self.calls}
+        with open(self.path, "w") as fs:
+            json.dump(profile, fs)
@@ -0,0 +1,332 @@
+# Generates the synthetic corpus in `fixtures/`- wikidot shaped pages, listings and AJAX module responses that the
+# replay server serves to the spiders and postprocessing. `run_benchmarks.py record` can replace it with pages
+# recorded from the live wiki.
+import random
+from datetime import datetime, timezone
+from pathlib import Path
+
+import typer
+
+from corpus import Corpus
+
+FIXTURES = Path(__file__).parent / "fixtures"
+DOMAIN = "scp-wiki.wikidot.com"
+
+WORDS = (
+    "containment procedures anomalous object foundation personnel site research document class safe euclid keter "
+    "subject observed incident report addendum interview recovered statue concrete rebar motion line sight blink "
+    "cleaning staff level clearance director memo note the of and to in is was for with on as by at"
+).split()
+
+# Pages to generate, with the number of each item.
+ITEMS = [
+    ("scp-002", 2),
+    ("scp-049", 49),
+    ("scp-173", 173),
+    ("scp-1000", 1000),
+    ("scp-2521", 2521),
+    ("scp-3000", 3000),
+    ("scp-5004", 5004),
+    ("scp-6500", 6500),
+    ("scp-096-j", 96),
+]
+TALES = ["a-tale-of-containment", "the-old-site", "foundation-story-1990"]
+GOIS = ["goi-format-gru-p", "goi-format-chaos-insurgency"]
+HUBS = ["cool-war-2-hub", "site-19-hub"]
+ALL_PAGES = [link for link, _ in ITEMS] + TALES + GOIS + HUBS
+FIRST_PAGE_ID = 1001
+
+SERIES = ["scp-series", "scp-series-2", "scp-series-3", "scp-series-4", "scp-series-6", "scp-series-7", "joke-scps"]
+SIDEBAR = [
+    "scp-series",
+    "scp-series-2",
+    "scp-series-6",
+    "tales-by-title",
+    "goi-formats",
+    "system:page-tags/tag/hub",
+    "licensing-guide",
+]
+DATE_FORMAT = "%d %b %Y %H:%M"
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<title>{title} - SCP Foundation</title>
+<script type="text/javascript"
+ src="//d3g0gp89917ko0.cloudfront.net/v--edac79f846ba/common--javascript/init.combined.js"></script>
+<script type="text/javascript">
+var URL_HOST = '{domain}';
+WIKIREQUEST = {{}};
+WIKIREQUEST.info = {{}};
+WIKIREQUEST.info.domain = "{domain}";
+WIKIREQUEST.info.siteId = 66711;
+WIKIREQUEST.info.categoryId = 375338;
+WIKIREQUEST.info.themeId = 1;
+WIKIREQUEST.info.requestPageName = "{link}";
+WIKIREQUEST.info.pageUnixName = "{link}";
+WIKIREQUEST.info.pageId = {page_id};
+WIKIREQUEST.info.lang = "en";
+</script>
+<meta http-equiv="content-type" content="text/html;charset=UTF-8"/>
+<link rel="stylesheet" type="text/css"
+ href="//d3g0gp89917ko0.cloudfront.net/v--edac79f846ba/common--theme/base/css/style.css"/>
+</head>
+<body id="html-body">
+<div id="skrollr-body">
+<div id="container-wrap-wrap"><div id="container-wrap"><div id="container">
+<div id="header"><h1><a href="/"><span>SCP Foundation</span></a></h1>
+<h2><span>Secure, Contain, Protect</span></h2></div>
+<div id="top-bar"><ul><li><a href="/scp-series">SCP Series</a></li>
+<li><a href="/tales-by-title">Tales</a></li></ul></div>
+<div id="content-wrap">
+<div id="side-bar"><div class="side-block">{sidebar}</div></div>
+<div id="main-content">
+<div id="action-area-top"></div>
+<div id="page-title">{title}</div>
+<div id="page-content">
+{content}
+</div>
+<div class="page-tags"><span>{tags}</span></div>
+<div style="clear:both; height:1px; font-size:1px;"></div>
+<div id="page-info">page revision: {revision}, last edited: <span
+ class="odate time_{edited_at} format_%25e%20%25b%20%25Y%2C%20%25H%3A%25M%7Cagohover">{edited}</span></div>
+<div id="page-options-bottom" class="page-options-bottom"><a href="javascript:;" id="edit-button">Edit</a><a
+ href="javascript:;" id="pagerate-button">Rate (<span id="prw54355">+{rating}</span>)</a></div>
+</div>
+</div>
+<div id="footer" style="display: block; visibility: visible;"><div class="options"><a
+ href="http://www.wikidot.com/doc">Help</a> |
+ <a href="http://www.wikidot.com/legal:terms-of-service">Terms of Service</a></div></div>
+</div></div></div>
+</div>
+</body>
+</html>
+"""
+
+RATING_BOX = (
+    '<div class="page-rate-widget-box"><span class="rate-points">rating:&nbsp;<span class="number prw54353">'
+    "+{rating}</span></span>"
+    '<span class="rateup btn btn-default"><a title="I like it" href="javascript:;"'
+    ' onclick="WIKIDOT.modules.PageRateWidgetModule.listeners.rate(event, 1)">+</a></span>'
+    '<span class="ratedown btn btn-default"><a title="I don\'t like it" href="javascript:;"'
+    ' onclick="WIKIDOT.modules.PageRateWidgetModule.listeners.rate(event, -1)">&#8211;</a></span>'
+    '<span class="cancel btn btn-default"><a title="Cancel my vote" href="javascript:;"'
+    ' onclick="WIKIDOT.modules.PageRateWidgetModule.listeners.cancelVote(event)">x</a></span></div>'
+)
+
+IMAGE_BLOCK = (
+    '<div class="scp-image-block block-right" style="width:300px;">'
+    '<img src="https://scp-wiki.wdfiles.com/local--files/page/image{index}.jpg" style="width:300px;"'
+    ' alt="image{index}" class="image" />'
+    '<div class="scp-image-caption" style="width:300px;"><p>Figure {index}</p></div></div>'
+)
+
+COLLAPSIBLE_BLOCK = (
+    '<div class="collapsible-block"><div class="collapsible-block-folded">'
+    '<a class="collapsible-block-link" href="javascript:;">+ Show Log</a></div>'
+    '<div class="collapsible-block-unfolded" style="display:none"><div class="collapsible-block-unfolded-link">'
+    '<a class="collapsible-block-link" href="javascript:;">- Hide Log</a></div>'
+    '<div class="collapsible-block-content">{content}</div></div></div>'
+)
+
+FOOTNOTES = (
+    '<div class="footnotes-footer"><div class="title">Footnotes</div>'
+    '<div class="footnote-footer" id="footnote-1"><a href="javascript:;">1</a>. {content}</div></div>'
+)
+
+WIKIWALK = (
+    '<div class="footer-wikiwalk-nav"><div style="text-align: center;">'
+    '<p>« <a href="/scp-001">SCP-001</a> | SCP-002 | <a href="/scp-003">SCP-003</a> »</p></div></div>'
+)
+
+LICENSE_BOX = (
+    '<div class="licensebox"><div class="collapsible-block"><div class="collapsible-block-folded">'
+    '<a class="collapsible-block-link" href="javascript:;">+ Show licensing</a></div></div></div>'
+    '<div style="clear:both;"></div><div></div>'
+)
+
+HISTORY_HEADER = (
+    '<table class="page-history"><tr><td>rev.</td><td>&nbsp;</td><td>flags</td><td>actions</td><td>by</td>'
+    "<td>date</td><td>comments</td></tr>"
+)
+
+HISTORY_ROW = (
+    '<tr id="revision-row-{page_id}{revision}"><td>{revision}.</td><td><a href="javascript:;">V</a></td>'
+    '<td><span class="spantip">S</span></td><td></td>'
+    '<td><span class="printuser avatarhover"><a href="http://www.wikidot.com/user:info/{user}">'
+    '<img class="small" src="https://www.wikidot.com/avatar.php?userid=1" alt="{user}" /></a>'
+    '<a href="http://www.wikidot.com/user:info/{user}">{user}</a></span></td>'
+    '<td><span class="odate">{date}</span></td><td>{comment}</td></tr>'
+)
+
+cli = typer.Typer()
+
+
+def get_sentence(words=14):
+    return " ".join(random.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def get_paragraph(links, sentences=5):
+    text = []
+    for _ in range(sentences):
+        sentence = get_sentence(random.randint(8, 22))
+        if links and random.random() < 0.3:
+            link = random.choice(links)
+            sentence += f' See <a href="/{link}">{link.upper()}</a>.'
+        text.append(sentence)
+    return "<p>" + " ".join(text) + "</p>"
+
+
+def get_table(rows=6):
+    cells = "".join(f"<tr><td>{2000 + row}</td><td>{get_sentence(6)}</td></tr>" for row in range(rows))
+    return f'<table class="wiki-content-table"><tr><th>Date</th><th>Event</th></tr>{cells}</table>'
+
+
+def get_body(links, rating, paragraphs=25, images=2, footer=True):
+    parts = ['<div style="text-align: right;">' + RATING_BOX.format(rating=rating) + "</div>"]
+    for index in range(images):
+        parts.append(IMAGE_BLOCK.format(index=index))
+    parts.append("<p><strong>Item #:</strong> SCP-XXXX</p><p><strong>Object Class:</strong> Euclid</p>")
+    for index in range(paragraphs):
+        parts.append(get_paragraph(links))
+        if index % 7 == 3:
+            parts.append(COLLAPSIBLE_BLOCK.format(content=get_paragraph(links, 4)))
+        if index % 9 == 5:
+            blockquote = f'<div class="blockquote"><p>{get_sentence(30)}</p></div>'
+            parts.append(blockquote + '<div></div><div class="spacer"> </div>')
+        if index % 11 == 2:
+            parts.append(get_table())
+    parts.append(FOOTNOTES.format(content=get_sentence(10)))
+    if footer:
+        parts.append(WIKIWALK)
+    parts.append(LICENSE_BOX)
+    return "\n".join(parts)
+
+
+def get_history(page_id):
+    # Returns the newest revision, when it was made and the history table. Rows are listed newest first.
+    revisions = random.randint(1, 40)
+    dates = {}
+    rows = []
+    for revision in reversed(range(revisions)):
+        user = f"user-{random.randint(1, 25)}"
+        dates[revision] = datetime(
+            2010 + revision // 4,
+            random.choice([1, 3, 7, 10]),
+            random.randint(1, 28),
+            random.randint(0, 23),
+            random.randint(0, 59),
+            tzinfo=timezone.utc,
+        )
+        comment = get_sentence(4) if revision % 3 else ""
+        date = dates[revision].strftime(DATE_FORMAT)
+        rows.append(HISTORY_ROW.format(page_id=page_id, revision=revision, user=user, date=date, comment=comment))
+    newest = revisions - 1
+    return newest, dates[newest], HISTORY_HEADER + "".join(rows) + "</table>"
+
+
+def get_page(link, title, page_id, tags, content, revision=0, edited=None):
+    # The page info carries the newest revision from the page's history, as it does on the wiki.
+    edited = edited or datetime(2023, 11, 14, 22, 13, tzinfo=timezone.utc)
+    return PAGE_TEMPLATE.format(
+        title=title,
+        domain=DOMAIN,
+        link=link,
+        page_id=page_id,
+        sidebar="".join(f'<div class="menu-item"><a href="/{item}">{item}</a></div>' for item in SIDEBAR),
+        content=content,
+        tags="".join(f'<a href="/system:page-tags/tag/{tag}#pages">{tag}</a>' for tag in tags),
+        revision=revision,
+        edited_at=int(edited.timestamp()),
+        edited=edited.strftime(DATE_FORMAT),
+        rating=random.randint(1, 900),
+    )
+
+
+def get_listing_page(link, title, content):
+    return get_page(link, title, 1, [], content)
+
+
+def get_pages_list(links):
+    items = "".join(
+        f'<div class="pages-list-item"><div class="title"><a href="/{link}">{link}</a></div></div>' for link in links
+    )
+    return f'<div class="pages-list"><div id="tagged-pages-list">{items}</div></div>'
+
+
+def get_hub_content():
+    entries = "".join(f'<li><a href="/{link}">{link}</a> - {get_sentence(4)}</li>' for link in ALL_PAGES)
+    panel = f'<div class="content-panel standalone series"><ul>{entries}</ul></div>'
+    return RATING_BOX.format(rating=100) + "".join(panel for _ in range(3))
+
+
+def get_article(link):
+    # Returns the title, tags and content of a generated page.
+    if link in HUBS:
+        return link.replace("-", " ").title(), ["hub", "tale"], get_hub_content()
+    if link in GOIS:
+        content = get_body(ALL_PAGES, random.randint(20, 200), paragraphs=20, images=1, footer=False)
+        return link, ["goi-format", "tale"], content
+    if link in TALES:
+        paragraphs = random.randint(20, 60)
+        content = get_body(ALL_PAGES, random.randint(20, 200), paragraphs=paragraphs, images=0, footer=False)
+        return link.replace("-", " ").title(), ["tale", "site-19"], content
+    tags = ["scp", "euclid", "sculpture"] + (["joke"] if link.endswith("-j") else [])
+    content = get_body(
+        ALL_PAGES, random.randint(50, 900), paragraphs=random.randint(15, 45), images=random.randint(0, 3)
+    )
+    return link.upper(), tags, content
+
+
+def get_series(link, number):
+    if link.endswith("-j"):
+        return "joke-scps"
+    if number < 1000:
+        return "scp-series"
+    return f"scp-series-{number // 1000 + 1}"
+
+
+def save_articles(corpus):
+    # Every page gets a history table and a wiki source along with the page itself.
+    for page_id, link in enumerate(ALL_PAGES, start=FIRST_PAGE_ID):
+        revision, edited, history = get_history(page_id)
+        title, tags, content = get_article(link)
+        corpus.save_page(link, get_page(link, title, page_id, tags, content, revision, edited))
+        corpus.save_ajax("history", page_id, {"status": "ok", "body": history})
+        source = "<br />".join(
+            get_sentence(12).replace("the", "[[[scp-002|the]]]") for _ in range(random.randint(20, 120))
+        )
+        corpus.save_ajax("viewsource", page_id, {"status": "ok", "body": f'<div class="page-source">{source}</div>'})
+
+
+def save_listings(corpus):
+    series = {link: [] for link in SERIES}
+    for link, number in ITEMS:
+        series[get_series(link, number)].append(link)
+    for link, links in series.items():
+        entries = "".join(f'<li><a href="/{item}">{item.upper()}</a> - {get_sentence(3)}</li>' for item in links)
+        content = f'<div class="content-panel standalone series"><ul>{entries}</ul></div>'
+        corpus.save_page(link, get_listing_page(link, link, content))
+
+    home_links = SERIES + ["tales-by-title", "goi-formats", "system:page-tags/tag/hub"]
+    home = "".join(f'<p><a href="/{link}">{link}</a></p>' for link in home_links)
+    corpus.save_page("", get_listing_page("main", "Main", home))
+    corpus.save_page("tales-by-title", get_listing_page("tales-by-title", "Tales By Title", get_pages_list(TALES)))
+    corpus.save_page("goi-formats", get_listing_page("goi-formats", "GOI Formats", get_pages_list(GOIS)))
+
+    tags = {"scp": [link for link, _ in ITEMS], "tale": TALES + GOIS + HUBS, "hub": HUBS, "goi-format": GOIS}
+    for tag, links in tags.items():
+        corpus.save_page(f"system:page-tags/tag/{tag}", get_listing_page(tag, f"Tag: {tag}", get_pages_list(links)))
+
+
+@cli.command()
+def main(corpus: Path = FIXTURES, seed: int = 173):
+    # The same seed always gives the same corpus.
+    random.seed(seed)
+    saver = Corpus(corpus)
+    save_articles(saver)
+    save_listings(saver)
+
+
+if __name__ == "__main__":
+    cli()
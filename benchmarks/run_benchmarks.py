@@ -0,0 +1,224 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import typer
+
+from corpus import Corpus, ReplayServer
+from scp_crawler import settings
+
+BENCHMARK_DIR = Path(__file__).parent
+REPO_DIR = BENCHMARK_DIR.parent
+FIXTURES = BENCHMARK_DIR / "fixtures"
+
+# Spiders in the order they have to run, and the feed each one writes.
+SPIDERS = {
+    "scp_titles": "scp_titles.jsonl",
+    "scp_hubs": "scp_hubs.jsonl",
+    "scp": "scp_items.jsonl",
+    "scp_tales": "scp_tales.jsonl",
+    "goi": "goi.jsonl",
+}
+
+# Postprocessing stages, and the feed each one reads.
+STAGES = {
+    "hubs": "scp_hubs.jsonl",
+    "items": "scp_items.jsonl",
+    "tales": "scp_tales.jsonl",
+    "goi": "goi.jsonl",
+}
+
+cli = typer.Typer()
+
+
+def get_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([str(REPO_DIR), str(BENCHMARK_DIR), env.get("PYTHONPATH", "")])
+    env["SCRAPY_SETTINGS_MODULE"] = "scp_crawler.settings"
+    return env
+
+
+def get_downloader_middlewares(middleware, order):
+    # The crawler's own downloader middlewares with one from the benchmark corpus added, as a setting value.
+    return json.dumps({**settings.DOWNLOADER_MIDDLEWARES, middleware: order})
+
+
+def run_measured(command, cwd, log_path):
+    # Runs a command and returns its wall time and resource usage (CPU time and peak RSS of that process alone).
+    # Output goes to `log_path` so it doesn't break up the results table.
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=cwd, env=get_env(), stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} exited with {process.returncode}, see {log_path}")
+    return elapsed, usage
+
+
+def count_lines(path):
+    if not path.exists():
+        return 0
+    with open(path, "rb") as fs:
+        return sum(1 for line in fs if line.strip())
+
+
+def crawl(spider, server, workdir):
+    profile_path = workdir / f"{spider}.profile.json"
+    command = [
+        sys.executable,
+        "-m",
+        "scrapy",
+        "crawl",
+        spider,
+        "-O",
+        f"data/{SPIDERS[spider]}",
+        "-s",
+        "LOG_LEVEL=WARNING",
+        "-s",
+        f"REPLAY_PROXY={server.url}",
+        "-s",
+        "DOWNLOADER_MIDDLEWARES=" + get_downloader_middlewares("corpus.ReplayProxyMiddleware", 100),
+        "-s",
+        "SPIDER_MIDDLEWARES=" + json.dumps({"corpus.CallbackProfiler": 1000}),
+        "-s",
+        f"CALLBACK_PROFILE={profile_path}",
+    ]
+    elapsed, usage = run_measured(command, workdir, workdir / f"{spider}.log")
+    with open(profile_path) as fs:
+        profile = json.load(fs)
+    return elapsed, usage, count_lines(workdir / "data" / SPIDERS[spider]), profile
+
+
+def postprocess(stage, server, workdir, workers):
+    command = [sys.executable, __file__, "postproc-stage", stage, server.url, "--workers", str(workers)]
+    elapsed, usage = run_measured(command, workdir, workdir / f"postproc_{stage}.log")
+    return elapsed, usage, count_lines(workdir / "data" / STAGES[stage])
+
+
+def print_row(name, elapsed, usage, count, requests):
+    total = sum(value for kind, value in requests.items() if kind != "missing")
+    pages = requests.get("page", 0) + requests.get("tag-listing", 0)
+    per_item = f"{total / count:8.2f}" if count else f"{'-':>8}"
+    print(
+        f"{name:<12} {elapsed:8.2f} {count:7d} {count / elapsed:9.1f} {pages / elapsed:9.1f} {total:8d} {per_item}"
+        f" {usage.ru_maxrss / 1024:9.1f} {usage.ru_utime + usage.ru_stime:8.2f}"
+        + (f"  ({requests['missing']} not in corpus)" if requests.get("missing") else "")
+    )
+
+
+def print_header(title):
+    print()
+    print(title)
+    print(
+        f"{'':<12} {'wall s':>8} {'items':>7} {'items/s':>9} {'pages/s':>9} {'requests':>8} {'req/item':>8}"
+        f" {'rss MB':>9} {'cpu s':>8}"
+    )
+
+
+@cli.command()
+def run(
+    corpus: Path = FIXTURES,
+    workdir: Path = None,
+    workers: int = 1,
+    spiders: bool = True,
+    postprocessing: bool = True,
+):
+    # Crawls the recorded corpus with every spider and then runs each postprocessing stage on the result.
+    workdir = Path(workdir or tempfile.mkdtemp(prefix="scp_benchmark_"))
+    (workdir / "data").mkdir(parents=True, exist_ok=True)
+    server = ReplayServer(Corpus(corpus)).start()
+    print(f"Replaying {corpus} from {server.url}, working in {workdir}")
+
+    profiles = {}
+    if spiders:
+        print_header("Spiders")
+        for spider in SPIDERS:
+            server.reset()
+            elapsed, usage, count, profiles[spider] = crawl(spider, server, workdir)
+            print_row(spider, elapsed, usage, count, server.reset())
+
+    if postprocessing:
+        print_header("Postprocessing")
+        for stage in STAGES:
+            server.reset()
+            elapsed, usage, count = postprocess(stage, server, workdir, workers)
+            print_row(stage, elapsed, usage, count, server.reset())
+
+    if profiles:
+        print()
+        print("Spider callback CPU time")
+        for spider, profile in profiles.items():
+            for name, stats in sorted(profile.items(), key=lambda entry: -entry[1]["cpu"]):
+                per_call = stats["cpu"] / stats["calls"] * 1000 if stats["calls"] else 0
+                print(f"{spider:<12} {name:<20} {stats['calls']:7d} calls {stats['cpu']:8.3f}s {per_call:8.2f}ms/call")
+    server.shutdown()
+
+
+@cli.command()
+def postproc_stage(stage: str, server: str, workers: int = 1):
+    # Runs one postprocessing stage against the replay server, with the current directory as the data root.
+    from scp_crawler import postprocessing
+    from scp_crawler.wikisource import SourceFetcher
+
+    if stage == "hubs":
+        postprocessing.process_hubs(workers=workers, force=True)
+        return
+
+    stages = {
+        "items": postprocessing.postproc_items,
+        "tales": postprocessing.postproc_tales,
+        "goi": postprocessing.postproc_goi,
+    }
+    with SourceFetcher(ajax_url=lambda domain: f"{server}/ajax-module-connector.php") as fetcher:
+        stages[stage](fetcher, workers=workers)
+
+
+@cli.command()
+def record(corpus: Path = FIXTURES, items: int = 25, workdir: Path = None):
+    # Crawls a sample of the live wiki with each spider and saves every response into `corpus`, along with the
+    # wiki source for each crawled page.
+    workdir = Path(workdir or tempfile.mkdtemp(prefix="scp_record_"))
+    (workdir / "data").mkdir(parents=True, exist_ok=True)
+    for spider, feed in SPIDERS.items():
+        command = [
+            sys.executable,
+            "-m",
+            "scrapy",
+            "crawl",
+            spider,
+            "-O",
+            f"data/{feed}",
+            "-s",
+            f"CLOSESPIDER_ITEMCOUNT={items}",
+            "-s",
+            "DOWNLOADER_MIDDLEWARES=" + get_downloader_middlewares("corpus.RecordingMiddleware", 950),
+            "-s",
+            f"RECORD_CORPUS={corpus.resolve()}",
+        ]
+        print(f"Recording {spider}")
+        run_measured(command, workdir, workdir / f"{spider}.log")
+
+    from scp_crawler.feeds import iter_records
+    from scp_crawler.wikisource import MAIN_TOKEN, get_ajax_url, get_source_form
+
+    saver = Corpus(corpus)
+    for feed in STAGES.values():
+        for record in iter_records(workdir / "data" / feed):
+            response = httpx.post(
+                get_ajax_url(record["domain"]),
+                data=get_source_form(record["page_id"]),
+                cookies={"wikidot_token7": MAIN_TOKEN},
+            )
+            if response.status_code == 200:
+                saver.save(saver.ajax_path("viewsource", record["page_id"]), response.content)
+
+
+if __name__ == "__main__":
+    cli()
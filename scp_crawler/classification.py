@@ -0,0 +1,75 @@
+import re
+from functools import lru_cache
+
+# The same links and identifiers come up on page after page, so lookups are memoized, up to this many of each.
+CACHE_SIZE = 65536
+
+SCP_IDENTIFIER = re.compile(r"scp(?:-[\w|\d]*)?-\d{3,4}(?:-[\w|\d]*)?")
+NUMBER = re.compile(r"[0-9]+")
+
+# Numbered series hold a thousand items each, and anything past the last one is "other".
+SERIES_SIZE = 1000
+MAX_SERIES = 19
+
+# Items from series 6 onwards are split into two content files at this point in the series.
+SPLIT_SERIES_FROM = 5000
+SPLIT_AT = 500
+
+# Tags that put an item in a series of its own, checked in this order after the identifier suffixes.
+SUFFIX_SERIES = (("-d", "decommissioned"), ("-ex", "explained"), ("-arc", "archived"))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_simple_link(url, domain):
+    return url.replace(f"http://{domain}/", "").replace(f"https://{domain}/", "")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_url_identifier(url):
+    match = SCP_IDENTIFIER.search(url)
+    return match[0] if match else None
+
+
+def get_scp_identifier(url, tags):
+    identifier = get_url_identifier(url)
+    if identifier:
+        return identifier
+    if "proposal" in url or "001-proposal" in tags:
+        return "scp-001"
+    if url.endswith("taboo") and "4000" in tags:
+        return "scp-4000"
+    return "unknown"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_scp_number(scp):
+    match = NUMBER.search(scp)
+    return int(match[0]) if match else 0
+
+
+def get_series(scp, tags):
+    identifier = scp.lower()
+    if identifier.endswith("-j") or "joke" in tags:
+        return "joke"
+    if "proposal" in scp or identifier == "scp-001":
+        return "scp-001"
+    for suffix, series in SUFFIX_SERIES:
+        if identifier.endswith(suffix) or series in tags:
+            return series
+    if "international" in tags:
+        return "international"
+
+    series = get_scp_number(scp) // SERIES_SIZE + 1
+    if series > MAX_SERIES:
+        return "other"
+    return f"series-{series}"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_series_label(series, scp_number):
+    # Larger series get split into two content files.
+    if series.startswith("series-") and scp_number >= SPLIT_SERIES_FROM:
+        if scp_number % SERIES_SIZE > SPLIT_AT:
+            return series + ".5"
+        return series + ".0"
+    return series
@@ -0,0 +1,195 @@
+import os
+import sqlite3
+from pathlib import Path
+
+from .export import DATASETS, iter_processed_records
+from .text import get_plain_text
+
+SCHEMA = """
+CREATE TABLE pages (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    page_id TEXT,
+    link TEXT,
+    url TEXT,
+    title TEXT,
+    scp TEXT,
+    scp_number INTEGER,
+    series TEXT,
+    rating INTEGER,
+    created_at TEXT,
+    creator TEXT,
+    last_edited_at TEXT,
+    last_editor TEXT,
+    revision_count INTEGER,
+    content_file TEXT,
+    in_degree INTEGER,
+    out_degree INTEGER,
+    pagerank REAL
+);
+CREATE TABLE tags (page INTEGER NOT NULL REFERENCES pages, tag TEXT NOT NULL);
+CREATE TABLE hubs (page INTEGER NOT NULL REFERENCES pages, hub TEXT NOT NULL);
+CREATE TABLE page_references (page INTEGER NOT NULL REFERENCES pages, link TEXT NOT NULL);
+CREATE TABLE revisions (
+    page INTEGER NOT NULL REFERENCES pages,
+    author TEXT,
+    author_href TEXT,
+    date TEXT,
+    comment TEXT
+);
+CREATE VIRTUAL TABLE content USING fts5(text, source, tokenize='porter unicode61');
+"""
+
+# Created once the tables are full, which is much faster than keeping them up to date during the load.
+INDEXES = """
+CREATE UNIQUE INDEX pages_key ON pages (type, key);
+CREATE INDEX pages_link ON pages (link);
+CREATE INDEX pages_series ON pages (series, scp_number);
+CREATE INDEX pages_creator ON pages (creator);
+CREATE INDEX tags_tag ON tags (tag, page);
+CREATE INDEX hubs_hub ON hubs (hub, page);
+CREATE INDEX page_references_link ON page_references (link, page);
+CREATE INDEX page_references_page ON page_references (page);
+CREATE INDEX revisions_author ON revisions (author, page);
+CREATE INDEX revisions_page ON revisions (page);
+"""
+
+PAGE_COLUMNS = (
+    "type",
+    "key",
+    "page_id",
+    "link",
+    "url",
+    "title",
+    "scp",
+    "scp_number",
+    "series",
+    "rating",
+    "created_at",
+    "creator",
+    "last_edited_at",
+    "last_editor",
+    "revision_count",
+    "content_file",
+    "in_degree",
+    "out_degree",
+    "pagerank",
+)
+
+
+def get_page_row(page_type, key, record):
+    row = {**record, "type": page_type, "key": key}
+    # Placeholders like "unknown" are stored as nulls.
+    if not isinstance(row.get("rating"), int):
+        row["rating"] = None
+    for column in ("created_at", "last_edited_at"):
+        if row.get(column) == "unknown":
+            row[column] = None
+    return [row.get(column) for column in PAGE_COLUMNS]
+
+
+def build_database(processed_path, database_path, datasets=DATASETS):
+    # Builds the database in a temporary file and swaps it in at the end, so readers never see a partial one.
+    processed_path = Path(processed_path)
+    temp_path = f"{database_path}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    db = sqlite3.connect(temp_path)
+    db.execute("PRAGMA journal_mode=OFF")
+    db.execute("PRAGMA synchronous=OFF")
+    db.executescript(SCHEMA)
+
+    insert_page = f"INSERT INTO pages ({', '.join(PAGE_COLUMNS)}) VALUES ({', '.join('?' * len(PAGE_COLUMNS))})"
+    for page_type in datasets:
+        directory = processed_path / page_type
+        if not (directory / "index.json").exists():
+            print(f"Skipping {page_type}, no processed data in {directory}")
+            continue
+
+        count = 0
+        for key, record in iter_processed_records(directory):
+            page = db.execute(insert_page, get_page_row(page_type, key, record)).lastrowid
+            db.executemany("INSERT INTO tags VALUES (?, ?)", [(page, tag) for tag in record.get("tags") or []])
+            db.executemany("INSERT INTO hubs VALUES (?, ?)", [(page, hub) for hub in record.get("hubs") or []])
+            db.executemany(
+                "INSERT INTO page_references VALUES (?, ?)", [(page, link) for link in record.get("references") or []]
+            )
+            db.executemany(
+                "INSERT INTO revisions VALUES (?, ?, ?, ?, ?)",
+                [
+                    (page, revision["author"], revision["author_href"] or None, revision["date"], revision["comment"])
+                    for revision in record.get("history") or []
+                ],
+            )
+            db.execute(
+                "INSERT INTO content (rowid, text, source) VALUES (?, ?, ?)",
+                (page, record.get("text") or get_plain_text(record.get("raw_content")), record.get("raw_source") or ""),
+            )
+            count += 1
+        print(f"Indexed {count} {page_type}")
+
+    db.executescript(INDEXES)
+    db.execute("INSERT INTO content (content) VALUES ('optimize')")
+    db.commit()
+    db.execute("VACUUM")
+    db.close()
+    os.replace(temp_path, database_path)
+    print(f"Saved database to {database_path}")
+
+
+# Words FTS5 treats as operators rather than search terms.
+FTS_OPERATORS = ("AND", "OR", "NOT")
+
+
+def get_match_query(text):
+    # FTS5 reads `scp-173` as a search of the `scp` column, so each plain term is quoted. A trailing `*` still does a
+    # prefix search. Text with quotes or brackets is left as it is, for the full query syntax.
+    if any(char in text for char in '"()'):
+        return text
+    terms = []
+    for term in text.split():
+        if term in FTS_OPERATORS:
+            terms.append(term)
+        elif term.endswith("*") and len(term) > 1:
+            terms.append(f'"{term[:-1]}"*')
+        else:
+            terms.append(f'"{term}"')
+    return " ".join(terms)
+
+
+def search_pages(db, text=None, tag=None, author=None, hub=None, page_type=None, limit=20):
+    # Every filter is optional. With `text` the results are ranked by relevance and include a snippet of the match,
+    # otherwise they're sorted by rating.
+    columns = "pages.type, pages.key, pages.title, pages.rating"
+    conditions = []
+    params = []
+    if text:
+        snippet = "snippet(content, 0, '[', ']', '...', 12)"
+        query = f"SELECT {columns}, {snippet} FROM content JOIN pages ON pages.id = content.rowid"
+        conditions.append("content MATCH ?")
+        params.append(get_match_query(text))
+        order = "content.rank"
+    else:
+        query = f"SELECT {columns}, NULL FROM pages"
+        order = "pages.rating DESC"
+
+    if tag:
+        conditions.append("pages.id IN (SELECT page FROM tags WHERE tag = ?)")
+        params.append(tag)
+    if author:
+        conditions.append("pages.creator = ?")
+        params.append(author)
+    if hub:
+        conditions.append("pages.id IN (SELECT page FROM hubs WHERE hub = ?)")
+        params.append(hub)
+    if page_type:
+        conditions.append("pages.type = ?")
+        params.append(page_type)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {order} LIMIT ?"
+    params.append(limit)
+    return db.execute(query, params).fetchall()
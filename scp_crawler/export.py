@@ -0,0 +1,198 @@
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+# Processed content types, each read from `data/processed/<name>`.
+DATASETS = ("items", "tales", "goi", "hubs")
+
+# Files next to the content shards that aren't shards themselves.
+CONTENT_INDEXES = ("content_index.json", "content_lookup.json")
+
+# Rows are buffered and written out this many at a time, one Parquet row group each.
+ROW_GROUP_SIZE = 1000
+
+# Page metadata, one row per page. `key` is the key the page has in its processed `index.json`.
+METADATA_COLUMNS = {
+    "key": "string",
+    "page_id": "string",
+    "link": "string",
+    "url": "string",
+    "domain": "string",
+    "title": "string",
+    "rating": "int",
+    "tags": "strings",
+    "hubs": "strings",
+    "references": "strings",
+    "images": "strings",
+    "created_at": "timestamp",
+    "creator": "string",
+    "last_edited_at": "timestamp",
+    "last_editor": "string",
+    "revision_count": "int",
+    "content_file": "string",
+    "word_count": "int",
+    "reading_time": "int",
+    "excerpt": "string",
+    "backlinks": "strings",
+    "in_degree": "int",
+    "out_degree": "int",
+    "pagerank": "float",
+}
+
+EXTRA_COLUMNS = {
+    "items": {"scp": "string", "scp_number": "int", "series": "string"},
+    "tales": {"year": "int"},
+}
+
+# The page content is most of the size of the dataset, so it gets its own file.
+CONTENT_COLUMNS = {
+    "key": "string",
+    "page_id": "string",
+    "raw_content": "string",
+    "raw_source": "string",
+    "text": "string",
+}
+
+REVISION_COLUMNS = {
+    "type": "string",
+    "key": "string",
+    "page_id": "string",
+    "author": "string",
+    "author_href": "string",
+    "date": "timestamp",
+    "comment": "string",
+}
+
+
+def get_arrow():
+    # pyarrow is an optional dependency, only needed for this export.
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow, install it with `pip install .[parquet]`.") from None
+    return pyarrow, pyarrow.parquet
+
+
+def get_schema(columns):
+    pa, _ = get_arrow()
+    types = {
+        "string": pa.string(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "strings": pa.list_(pa.string()),
+        "timestamp": pa.timestamp("s"),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns.items()])
+
+
+def coerce(value, kind):
+    # Processed records use "unknown", `False` and so on for missing values, which become nulls here.
+    if value is None or value is False:
+        return None
+    if kind == "int":
+        if isinstance(value, int):
+            return value
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    if kind == "float":
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if kind == "timestamp":
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+    if kind == "strings":
+        return [str(entry) for entry in value] if isinstance(value, list) else None
+    return str(value)
+
+
+def get_row(record, columns):
+    return {name: coerce(record.get(name), kind) for name, kind in columns.items()}
+
+
+class ParquetTableWriter:
+    # Writes rows to a Parquet file a row group at a time, so a table never has to be in memory all at once.
+
+    def __init__(self, path, columns):
+        _, pq = get_arrow()
+        self.path = path
+        self.columns = columns
+        self.schema = get_schema(columns)
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self.rows = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, record):
+        self.rows.append(get_row(record, self.columns))
+        self.count += 1
+        if len(self.rows) >= ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            pa, _ = get_arrow()
+            self.writer.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        print(f"Saved {self.count} rows to {self.path}")
+
+
+def iter_processed_records(directory):
+    # Full records, with their content, from the `content_*.json` shards. Hubs aren't sharded, so theirs come from
+    # the index. Shards are loaded one at a time.
+    with open(directory / "index.json", "r") as fs:
+        index = json.load(fs)
+    shards = sorted(path for path in directory.glob("content_*.json") if path.name not in CONTENT_INDEXES)
+    if not shards:
+        yield from index.items()
+        return
+
+    for shard in shards:
+        with open(shard, "r") as fs:
+            records = json.load(fs)
+        for key, record in records.items():
+            # Shards are written before the index adds `content_file` and the reference graph fields.
+            record.setdefault("content_file", shard.name)
+            record.update(index.get(key, {}))
+            yield key, record
+
+
+def export_parquet(processed_path, output_path, datasets=DATASETS):
+    # Writes `<type>.parquet` (metadata) and `<type>_content.parquet` (raw content and source) for each processed
+    # content type, and one `revisions.parquet` with the history of every page.
+    processed_path = Path(processed_path)
+    output_path = Path(output_path)
+    os.makedirs(output_path, exist_ok=True)
+
+    with ParquetTableWriter(output_path / "revisions.parquet", REVISION_COLUMNS) as revisions:
+        for name in datasets:
+            directory = processed_path / name
+            if not (directory / "index.json").exists():
+                print(f"Skipping {name}, no processed data in {directory}")
+                continue
+
+            columns = {**METADATA_COLUMNS, **EXTRA_COLUMNS.get(name, {})}
+            metadata = ParquetTableWriter(output_path / f"{name}.parquet", columns)
+            content = ParquetTableWriter(output_path / f"{name}_content.parquet", CONTENT_COLUMNS)
+            with metadata, content:
+                for key, record in iter_processed_records(directory):
+                    metadata.write({**record, "key": key})
+                    content.write({**record, "key": key})
+                    for revision in record.get("history") or []:
+                        revisions.write({**revision, "type": name, "key": key, "page_id": record.get("page_id")})
@@ -0,0 +1,128 @@
+import logging
+import os
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.extensions.feedexport import FeedExporter
+from scrapy.utils.job import job_dir
+from twisted.internet import task
+
+from .pipelines import DedupePipeline
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlCheckpoint:
+    # Runs alongside JOBDIR, which already keeps the request queue and seen requests on disk. Every CHECKPOINT_INTERVAL
+    # seconds this flushes the feeds, so an interrupted crawl loses as little as possible, and logs how much of the
+    # frontier is left. Only then are the keys of the flushed items recorded by `DedupePipeline`. A `finished` file is
+    # written to the job directory once the spider completes, which is how scripts tell a finished job from an
+    # interrupted one. A crawl killed in the middle of writing an item leaves part of a line at the end of a JSON Lines
+    # feed, which is dropped before the resumed crawl appends to it.
+
+    def __init__(self, crawler, jobdir, interval):
+        self.crawler = crawler
+        self.jobdir = jobdir
+        self.interval = interval
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        jobdir = job_dir(crawler.settings)
+        if not jobdir:
+            raise NotConfigured
+        extension = cls(crawler, jobdir, crawler.settings.getfloat("CHECKPOINT_INTERVAL", 60))
+        extension.drop_partial_items()
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    @property
+    def finished_path(self):
+        return os.path.join(self.jobdir, "finished")
+
+    def spider_opened(self, spider):
+        if os.path.exists(self.finished_path):
+            logger.warning(f"The job in {self.jobdir} already finished, remove it to crawl again from the start.")
+        state = getattr(spider, "state", {})
+        state["runs"] = state.get("runs", 0) + 1
+        state["items_before"] = state.get("items", 0)
+        if state["runs"] > 1:
+            logger.info(
+                f"Resuming job in {self.jobdir} (run {state['runs']}) with {self.get_queued()} queued requests and "
+                f"{state.get('items', 0)} items already scraped"
+            )
+        self.loop = task.LoopingCall(self.checkpoint)
+        self.loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.loop and self.loop.running:
+            self.loop.stop()
+        self.checkpoint()
+        if reason == "finished":
+            with open(self.finished_path, "w") as fs:
+                fs.write(reason)
+
+    def drop_partial_items(self):
+        for uri, options in self.crawler.settings.getdict("FEEDS").items():
+            path = get_local_path(str(uri))
+            if path and options.get("format") in ("jsonlines", "jl") and os.path.exists(path):
+                dropped = drop_partial_line(path)
+                if dropped:
+                    logger.warning(f"Dropped {dropped} bytes of a partly written item from the end of {path}")
+
+    def get_queued(self):
+        scheduler = self.crawler.engine.scheduler
+        return len(scheduler) if scheduler is not None else 0
+
+    def checkpoint(self):
+        for extension in self.crawler.extensions.middlewares:
+            if isinstance(extension, FeedExporter):
+                for slot in extension.slots:
+                    if slot.file:
+                        slot.file.flush()
+        for pipeline in self.crawler.engine.scraper.itemproc.middlewares:
+            if isinstance(pipeline, DedupePipeline):
+                pipeline.checkpoint()
+
+        stats = self.crawler.stats
+        spider = self.crawler.spider
+        state = getattr(spider, "state", {})
+        scraped = stats.get_value("item_scraped_count", 0)
+        state["items"] = state.get("items_before", 0) + scraped
+        queued = self.get_queued()
+        in_progress = len(self.crawler.engine.downloader.active)
+        stats.set_value("checkpoint/queued", queued)
+        logger.info(
+            f"Frontier: {queued} requests queued, {in_progress} in progress, {state['items']} items scraped "
+            f"across {state.get('runs', 1)} run(s)"
+        )
+
+
+def get_local_path(uri):
+    # Feeds written to a local file, other than ones with a placeholder in their name.
+    if "%(" in uri:
+        return None
+    if uri.startswith("file://"):
+        return uri[len("file://") :]
+    if "://" in uri:
+        return None
+    return uri
+
+
+def drop_partial_line(path, block_size=65536):
+    # Truncates the file after its last newline, returning how many bytes were removed.
+    with open(path, "rb+") as fs:
+        end = fs.seek(0, os.SEEK_END)
+        keep = end
+        while keep > 0:
+            start = max(0, keep - block_size)
+            fs.seek(start)
+            newline = fs.read(keep - start).rfind(b"\n")
+            if newline >= 0:
+                keep = start + newline + 1
+                break
+            keep = start
+        if keep < end:
+            fs.truncate(keep)
+        return end - keep
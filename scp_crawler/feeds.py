@@ -0,0 +1,290 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+# Written next to the output of a `ShardedJsonWriter`.
+HASHES_FILE = "hashes.json"
+CHANGES_FILE = "changes.json"
+
+# Bumped whenever the layout of the files changes, so that everything written the old way gets replaced once.
+HASHES_VERSION = 2
+
+
+def iter_records(path):
+    # Streams records out of a crawl feed. JSON Lines files are read one line at a time, while older JSON array
+    # feeds still have to be loaded in one go.
+    if str(path).endswith(".json"):
+        with open(path, "r") as fs:
+            yield from json.load(fs)
+        return
+
+    with open(path, "r") as fs:
+        for line in fs:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def count_records(path):
+    if str(path).endswith(".json"):
+        return None
+    count = 0
+    with open(path, "rb") as fs:
+        for block in iter(lambda: fs.read(1 << 20), b""):
+            count += block.count(b"\n")
+    return count
+
+
+class JsonObjectWriter:
+    # Writes a JSON object to disk one key at a time so its values never have to be in memory together. The output
+    # matches `json.dump(obj, sort_keys=True)` whatever order the keys were written in, so a file only changes when
+    # its values do. As with a dict, if a key is written twice the last value is kept.
+    #
+    # Values are serialized as they're written and spooled to a temporary file, and only written out in key order by
+    # `close`, to a file that then replaces the existing one. A hash of every value is kept, and a file whose hashes
+    # match its entry in `previous` (the hashes from the last time it was written) is left as it is.
+    #
+    # With `max_bytes` the object is split into numbered parts (`content_goi.json` becomes `content_goi_1.json`,
+    # `content_goi_2.json` and so on) of at most that many bytes, unless a single value is larger than that.
+    # `fields` is called with each key before the values are written out and returns fields to add to its value, for
+    # values that depend on where other records ended up.
+    #
+    # Once `lay_out` has run, `files` has the hashes of each file and `locations` the file, byte offset and length of
+    # each value, so a single record can be read back with a range request. JSON is written ASCII only, so characters
+    # and bytes line up.
+
+    def __init__(self, path, default=None, previous=None, max_bytes=0, fields=None):
+        self.path = Path(path)
+        self.default = default
+        self.previous = previous or {}
+        self.max_bytes = max_bytes
+        self.fields = fields
+        self.spool = None
+        self.spool_size = 0
+        self.pending = {}
+        self.hashes = {}
+        self.files = None
+        self.locations = None
+        self.changed = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, key, value):
+        self.write_serialized(key, json.dumps(value, sort_keys=True, default=self.default))
+
+    def write_serialized(self, key, serialized):
+        if self.spool is None:
+            self.spool = tempfile.TemporaryFile(dir=self.path.parent)
+        data = serialized.encode()
+        self.spool.seek(self.spool_size)
+        self.spool.write(data)
+        self.pending[str(key)] = (self.spool_size, len(data))
+        self.hashes[str(key)] = hashlib.sha1(data).hexdigest()
+        self.spool_size += len(data)
+
+    def read(self, key):
+        offset, length = self.pending[key]
+        self.spool.seek(offset)
+        return self.spool.read(length).decode()
+
+    def get_filename(self, part):
+        if not self.max_bytes:
+            return self.path.name
+        stem, extension = os.path.splitext(self.path.name)
+        return f"{stem}_{part}{extension}"
+
+    def add_fields(self):
+        # Spools every value again with its `fields` added.
+        spool, pending = self.spool, self.pending
+        self.spool, self.spool_size, self.pending = None, 0, {}
+        for key, (offset, length) in pending.items():
+            spool.seek(offset)
+            value = json.loads(spool.read(length))
+            value.update(self.fields(key))
+            self.write(key, value)
+        if spool is not None:
+            spool.close()
+
+    def lay_out(self):
+        # Works out which file each value goes in, and where, with the keys in order.
+        if self.files is not None:
+            return
+        if self.fields is not None:
+            self.add_fields()
+        part = 1
+        filename = self.get_filename(part)
+        self.files = {filename: {}}
+        self.locations = {}
+        size = 1
+        for key in sorted(self.pending):
+            prefix = f"{json.dumps(key)}: "
+            length = self.pending[key][1]
+            separator = 2 if self.files[filename] else 0
+            if self.max_bytes and self.files[filename] and size + separator + len(prefix) + length + 1 > self.max_bytes:
+                part += 1
+                filename = self.get_filename(part)
+                self.files[filename] = {}
+                size, separator = 1, 0
+            self.locations[key] = (filename, size + separator + len(prefix), length)
+            self.files[filename][key] = self.hashes[key]
+            size += separator + len(prefix) + length
+
+    def close(self):
+        if self.changed is not None:
+            return
+        self.lay_out()
+        self.changed = {}
+        for filename, hashes in self.files.items():
+            path = self.path.parent / filename
+            self.changed[filename] = hashes != self.previous.get(filename) or not path.exists()
+            if not self.changed[filename]:
+                continue
+            temp_path = f"{path}.part"
+            with open(temp_path, "w") as fs:
+                fs.write("{")
+                for position, key in enumerate(hashes):
+                    fs.write(f"{', ' if position else ''}{json.dumps(key)}: ")
+                    fs.write(self.read(key))
+                fs.write("}")
+            os.replace(temp_path, path)
+        self.close_spool()
+
+    def abort(self):
+        # Throws away everything written so far and leaves the existing files as they were.
+        self.changed = {}
+        self.close_spool()
+
+    def close_spool(self):
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+
+class ShardedJsonWriter:
+    # A set of `JsonObjectWriter`s in one directory, opened as records for each file show up.
+    #
+    # The hashes of every record are saved in `hashes.json` so the next run only replaces files whose records
+    # changed, and deletes the ones it no longer writes. `changes.json` lists the keys added, updated and removed in
+    # each file this run touched, so publishing can copy just those files. If the writer exits with an exception
+    # none of the files are replaced.
+    #
+    # Records written with `write` are content, split into parts of at most `max_bytes`. Which part each one lands in
+    # and where is only settled once all of them are in, see `get_locations`.
+
+    def __init__(self, directory, default=None, max_bytes=0):
+        self.directory = Path(directory)
+        self.default = default
+        self.max_bytes = max_bytes
+        self.writers = {}
+        self.content = []
+        self.locations = None
+        # Files from an older layout are all replaced, but the ones no longer written are still removed.
+        self.previous = {}
+        self.previous_files = {}
+        if os.path.exists(self.directory / HASHES_FILE):
+            with open(self.directory / HASHES_FILE, "r") as fs:
+                saved = json.load(fs)
+            self.previous_files = saved.get("files", saved)
+            if saved.get("version") == HASHES_VERSION:
+                self.previous = self.previous_files
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+            return
+        for writer in self.writers.values():
+            writer.abort()
+
+    def get_writer(self, filename, max_bytes=0, fields=None):
+        if filename not in self.writers:
+            self.writers[filename] = JsonObjectWriter(
+                self.directory / filename,
+                default=self.default,
+                previous=self.previous,
+                max_bytes=max_bytes,
+                fields=fields,
+            )
+        return self.writers[filename]
+
+    def write(self, filename, key, value):
+        if filename not in self.writers:
+            self.content.append(filename)
+        self.get_writer(filename, max_bytes=self.max_bytes).write(key, value)
+
+    def get_locations(self):
+        # The file, byte offset and length of every content record. No more content can be written after this.
+        if self.locations is None:
+            self.locations = {}
+            for filename in self.content:
+                writer = self.writers[filename]
+                writer.lay_out()
+                for key, (part, offset, length) in writer.locations.items():
+                    self.locations[key] = {"file": part, "offset": offset, "length": length}
+        return self.locations
+
+    def get_content_file(self, key):
+        return self.get_locations()[str(key)]["file"]
+
+    def get_parts(self, filename):
+        self.get_locations()
+        return list(self.writers[filename].files)
+
+    def write_object(self, filename, obj):
+        # Same output as `json.dump(obj, sort_keys=True)`.
+        writer = self.get_writer(filename)
+        for key, value in obj.items():
+            writer.write(key, value)
+
+    def close(self):
+        changes = {}
+        hashes = {}
+        for writer in self.writers.values():
+            writer.close()
+            for filename, file_hashes in writer.files.items():
+                hashes[filename] = file_hashes
+                path = self.directory / filename
+                if not writer.changed[filename]:
+                    print(f"Unchanged {len(file_hashes)} records in {path}")
+                    continue
+                print(f"Saved {len(file_hashes)} records to {path}")
+                changes[filename] = get_changes(self.previous.get(filename, {}), file_hashes)
+
+        for filename, file_hashes in self.previous_files.items():
+            if filename in hashes:
+                continue
+            # Nothing went into this file this time around.
+            if os.path.exists(self.directory / filename):
+                print(f"Removing {self.directory / filename}")
+                os.remove(self.directory / filename)
+            changes[filename] = get_changes(file_hashes, {})
+
+        with open(self.directory / HASHES_FILE, "w") as fs:
+            json.dump({"version": HASHES_VERSION, "files": hashes}, fs, sort_keys=True)
+        with open(self.directory / CHANGES_FILE, "w") as fs:
+            json.dump(changes, fs, sort_keys=True, indent=2)
+
+
+def clear_changes(directory):
+    # For output that is left as it is, so the changes from the run that last wrote it aren't published again.
+    with open(Path(directory) / CHANGES_FILE, "w") as fs:
+        json.dump({}, fs)
+
+
+def get_changes(previous, current):
+    return {
+        "added": sorted(key for key in current if key not in previous),
+        "updated": sorted(key for key in current if key in previous and current[key] != previous[key]),
+        "removed": sorted(key for key in previous if key not in current),
+    }
@@ -0,0 +1,137 @@
+import logging
+import os
+import pickle
+import re
+import sqlite3
+import zlib
+from time import time
+
+from scrapy.extensions.httpcache import DummyPolicy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.project import data_path
+
+from .middlewares import get_endpoint
+
+logger = logging.getLogger(__name__)
+
+# Seconds each type of page stays fresh. `None` never expires and `0` keeps that type out of the cache.
+DEFAULT_TTL = {
+    # Series indexes and similar listings change whenever a page is added.
+    "index": 6 * 3600,
+    "tags": 6 * 3600,
+    # Articles are checked against their history on every crawl, see `WikiMixin.get_page_source_request`.
+    "page": 30 * 24 * 3600,
+    # History lookups are how changed articles get noticed, so they are always fetched.
+    "ajax": 0,
+}
+
+INDEX_PAGES = re.compile(r"(|robots\.txt|scp-series(-\d+)?|joke-scps|scp-ex|tales-by-title|goi-formats)")
+
+
+def get_page_type(request):
+    endpoint = get_endpoint(request)
+    if endpoint == "page" and INDEX_PAGES.fullmatch(urlparse_cached(request).path.strip("/")):
+        return "index"
+    return endpoint
+
+
+class SqliteCacheStorage:
+    # HTTP cache storage that keeps every response for a spider in one SQLite file, with zlib compressed headers and
+    # bodies. Writes are committed in batches of HTTPCACHE_SQLITE_BATCH.
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings["HTTPCACHE_DIR"], createdir=True)
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.batch = settings.getint("HTTPCACHE_SQLITE_BATCH", 100)
+        self.pending = 0
+        self.db = None
+
+    def open_spider(self, spider):
+        path = os.path.join(self.cachedir, f"{spider.name}.sqlite")
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                fingerprint TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                page_type TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers BLOB NOT NULL,
+                body BLOB NOT NULL,
+                stored_at REAL NOT NULL
+            )
+            """
+        )
+        self.fingerprinter = spider.crawler.request_fingerprinter
+        logger.debug(f"Using SQLite cache storage in {path}")
+
+    def close_spider(self, spider):
+        self.db.commit()
+        self.db.close()
+
+    def retrieve_response(self, spider, request):
+        key = self.fingerprinter.fingerprint(request).hex()
+        row = self.db.execute(
+            "SELECT url, status, headers, body, stored_at FROM responses WHERE fingerprint = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, stored_at = row
+        if 0 < self.expiration_secs < time() - stored_at:
+            return None
+
+        # Used by the policy to work out the age of the response.
+        request.meta["cache_timestamp"] = stored_at
+        headers = Headers(pickle.loads(zlib.decompress(headers)))
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        key = self.fingerprinter.fingerprint(request).hex()
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                response.url,
+                get_page_type(request),
+                response.status,
+                zlib.compress(pickle.dumps(dict(response.headers), protocol=4)),
+                zlib.compress(response.body),
+                time(),
+            ),
+        )
+        self.pending += 1
+        if self.pending >= self.batch:
+            self.db.commit()
+            self.pending = 0
+
+
+class WikiCachePolicy(DummyPolicy):
+    # Freshness by page type, from HTTPCACHE_TTL on top of `DEFAULT_TTL`. A request with the `cache_refresh` meta key
+    # skips the cached copy and replaces it with the new response. Only successful responses are stored, and a stale
+    # copy is served when the wiki answers with a server error.
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.ttl = {**DEFAULT_TTL, **settings.getdict("HTTPCACHE_TTL")}
+
+    def should_cache_request(self, request):
+        return super().should_cache_request(request) and self.ttl.get(get_page_type(request)) != 0
+
+    def should_cache_response(self, response, request):
+        return super().should_cache_response(response, request) and response.status == 200
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        if request.meta.get("cache_refresh"):
+            return False
+        ttl = self.ttl.get(get_page_type(request))
+        if ttl is None:
+            return True
+        return time() - request.meta.get("cache_timestamp", 0) < ttl
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        return response.status >= 500
@@ -5,7 +5,13 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import logging
+from time import monotonic
+
 from scrapy import signals
+from scrapy.utils.httpobj import urlparse_cached
+
+logger = logging.getLogger(__name__)
 
 
 class ScpCrawlerSpiderMiddleware(object):
@@ -101,3 +107,124 @@ class ScpCrawlerDownloaderMiddleware(object):
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+def get_endpoint(request):
+    # Groups requests by how the wiki treats them- ajax module calls and tag listings are much heavier than pages.
+    path = urlparse_cached(request).path
+    if path.endswith("ajax-module-connector.php"):
+        return "ajax"
+    if path.startswith("/system:page-tags"):
+        return "tags"
+    return "page"
+
+
+class EndpointBudget:
+    def __init__(self, concurrency, delay):
+        self.max_concurrency = concurrency
+        self.concurrency = concurrency
+        self.min_delay = delay
+        self.delay = delay
+        self.successes = 0
+        self.backed_off_at = 0
+
+
+class EndpointThrottleMiddleware:
+    # Gives page GETs, ajax module calls and tag listings their own downloader slot per domain, so each has its own
+    # concurrency (ENDPOINT_CONCURRENCY) and delay (ENDPOINT_DELAY), and AutoThrottle tracks their latency
+    # separately. A 503 or 429 halves the concurrency and doubles the delay of that endpoint alone, honoring any
+    # Retry-After, and it is eased back after every ENDPOINT_RECOVERY successful responses. The other endpoints keep
+    # going and pick up whatever share of CONCURRENT_REQUESTS the throttled one leaves free.
+
+    backoff_statuses = (429, 503)
+
+    def __init__(self, crawler, concurrency, delays, max_delay, recovery):
+        self.crawler = crawler
+        self.concurrency = concurrency
+        self.delays = delays
+        self.max_delay = max_delay
+        self.recovery = recovery
+        self.autothrottle = crawler.settings.getbool("AUTOTHROTTLE_ENABLED")
+        self.budgets = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            crawler,
+            concurrency=settings.getdict("ENDPOINT_CONCURRENCY"),
+            delays=settings.getdict("ENDPOINT_DELAY"),
+            max_delay=settings.getfloat("ENDPOINT_MAX_DELAY", 60.0),
+            recovery=settings.getint("ENDPOINT_RECOVERY", 20),
+        )
+
+    def get_budget(self, key, endpoint):
+        if key not in self.budgets:
+            concurrency = self.concurrency.get(endpoint, self.crawler.settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN"))
+            self.budgets[key] = EndpointBudget(int(concurrency), float(self.delays.get(endpoint, 0)))
+        return self.budgets[key]
+
+    def apply(self, key, budget):
+        # Slots are created by the downloader after this middleware has seen the request, and dropped again once
+        # idle. The budget goes into the downloader's DOWNLOAD_SLOTS settings, which every new slot starts from, and
+        # onto the current slot if there is one. With AutoThrottle on it owns the delay and the budget only sets a
+        # floor.
+        downloader = self.crawler.engine.downloader
+        slot_settings = downloader.per_slot_settings.setdefault(key, {})
+        slot_settings["concurrency"] = budget.concurrency
+        slot_settings["delay"] = budget.delay
+        slot = downloader.slots.get(key)
+        if slot is None:
+            return
+        slot.concurrency = budget.concurrency
+        slot.delay = max(slot.delay, budget.delay) if self.autothrottle else budget.delay
+
+    def process_request(self, request, spider=None):
+        url = urlparse_cached(request)
+        if url.scheme not in ("http", "https"):
+            return None
+        endpoint = get_endpoint(request)
+        key = request.meta.setdefault("download_slot", f"{url.hostname}:{endpoint}")
+        request.meta["endpoint_sent_at"] = monotonic()
+        self.apply(key, self.get_budget(key, endpoint))
+        return None
+
+    def process_response(self, request, response, spider=None):
+        key = request.meta.get("download_slot")
+        if key not in self.budgets or "cached" in response.flags:
+            return response
+        budget = self.budgets[key]
+
+        if response.status in self.backoff_statuses:
+            # Requests already in flight when the last back off happened would pile on for the same overload.
+            if request.meta.get("endpoint_sent_at", 0) >= budget.backed_off_at:
+                self.back_off(key, budget, response)
+        elif response.status < 400:
+            budget.successes += 1
+            if budget.successes >= self.recovery:
+                budget.successes = 0
+                budget.concurrency = min(budget.max_concurrency, budget.concurrency + 1)
+                budget.delay = max(budget.min_delay, budget.delay / 2)
+
+        self.apply(key, budget)
+        return response
+
+    def back_off(self, key, budget, response):
+        retry_after = get_retry_after(response)
+        budget.concurrency = max(1, budget.concurrency // 2)
+        budget.delay = min(self.max_delay, max(budget.delay * 2, retry_after, 1.0))
+        budget.successes = 0
+        budget.backed_off_at = monotonic()
+        self.crawler.stats.inc_value(f"endpoint_throttle/{key}/backoff")
+        logger.info(
+            f"Got {response.status} from {key}, backing off to {budget.concurrency} concurrent requests with a "
+            f"{budget.delay:.1f}s delay"
+        )
+
+
+def get_retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After", b"0").decode())
+    except ValueError:
+        # The HTTP date form isn't worth handling, the backoff will get there.
+        return 0
@@ -5,7 +5,64 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import os
+
+from scrapy import signals
+from scrapy.exceptions import DropItem
+from scrapy.utils.job import job_dir
+
 
 class ScpCrawlerPipeline(object):
     def process_item(self, item, spider):
         return item
+
+
+class DedupePipeline:
+    # Drops an item when one of the same type has already been scraped for the same page, such as when a page is
+    # reached through more than one URL. With a JOBDIR the keys are also written to the job directory, so a resumed
+    # crawl won't repeat items the interrupted run already wrote to the feed. Keys are only written by `checkpoint`,
+    # which `CrawlCheckpoint` calls once it has flushed the feeds, so every key on disk has its item in the feed.
+
+    def __init__(self, path=None):
+        self.path = path
+        self.seen = set()
+        self.pending = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        jobdir = job_dir(crawler.settings)
+        pipeline = cls(os.path.join(jobdir, "items.seen") if jobdir else None)
+        crawler.signals.connect(pipeline.item_scraped, signal=signals.item_scraped)
+        return pipeline
+
+    def open_spider(self, spider=None):
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r") as fs:
+                self.seen.update(line.strip() for line in fs)
+
+    def get_key(self, item):
+        if "page_id" not in item:
+            return None
+        return f"{type(item).__name__}:{item['page_id']}"
+
+    def process_item(self, item, spider=None):
+        key = self.get_key(item)
+        if key is None:
+            return item
+        if key in self.seen:
+            raise DropItem(f"Already scraped {key}")
+        self.seen.add(key)
+        return item
+
+    def item_scraped(self, item, spider=None):
+        # Sent once the feeds have been handed the item.
+        key = self.get_key(item)
+        if self.path and key is not None:
+            self.pending.append(key)
+
+    def checkpoint(self):
+        if not self.pending:
+            return
+        with open(self.path, "a") as fs:
+            fs.writelines(f"{key}\n" for key in self.pending)
+        self.pending = []
@@ -1,19 +1,43 @@
-import html
-import json
+import functools
 import os
-import re
+import sqlite3
 import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
 from datetime import date, datetime
+from operator import itemgetter
 from pathlib import Path
 
-import httpx
 import typer
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 
+from .classification import get_series_label
+from .database import build_database, search_pages
+from .export import export_parquet
+from .feeds import HASHES_FILE, ShardedJsonWriter, clear_changes, count_records, iter_records
+from .references import ReferenceGraph, ReferenceIndex
+from .text import TextCache, add_text_fields
+from .wikisource import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_RATE_LIMIT,
+    SourceCache,
+    SourceFetcher,
+)
+
 cwd = os.getcwd()
 
-MAIN_TOKEN = "123456"
+SOURCE_CACHE = cwd + "/.cache/wiki_source.sqlite"
+TEXT_CACHE = cwd + "/.cache/page_text.sqlite"
+DATABASE = cwd + "/data/scp.sqlite"
+
+DEFAULT_WORKERS = 1
+DEFAULT_CHUNKSIZE = 32
+# Largest content shard in bytes, `0` keeps one shard per series or year however big it gets.
+DEFAULT_SHARD_SIZE = 0
+
+# Crawl feeds whose pages make up the reference graph.
+GRAPH_FEEDS = ("scp_items.jsonl", "scp_tales.jsonl", "goi.jsonl", "scp_hubs.jsonl")
 
 cli = typer.Typer()
 
@@ -26,251 +50,442 @@ def json_serial(obj):
     return str(obj)
 
 
-def from_file(path):
-    with open(path, "r") as fs:
-        data = json.load(fs)
-    return data
-
-
-def to_file(obj, path):
-    with open(path, "w") as fs:
-        print(f"Saving data to {path}")
-        json.dump(obj, fs, sort_keys=True, default=json_serial)
-
-
 def get_images(html):
     content_soup = BeautifulSoup(html, "lxml")
     img_tags = content_soup.find_all("img")
     return [img["src"] for img in img_tags if not img["src"].startswith("https://www.wikidot.com/avatar.php")]
 
 
+# Wikidot always writes dates in English, whatever the locale here is.
+MONTHS = {month: number for number, month in enumerate("Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split(), 1)}
+
+
+def parse_revision_date(value):
+    # Same result as `datetime.strptime(value, "%d %b %Y %H:%M")` in a fraction of the time, which adds up over
+    # every revision of every page. Anything in another format goes through strptime.
+    try:
+        day, month, year, clock = value.split()
+        hour, minute = clock.split(":")
+        return datetime(int(year), MONTHS[month], int(day), int(hour), int(minute))
+    except (KeyError, ValueError):
+        return datetime.strptime(value, "%d %b %Y %H:%M")
+
+
 def process_history(history):
-    history = [v for v in history.values()]
+    history = list(history.values())
     for revision in history:
-        revision["date"] = datetime.strptime(revision["date"], "%d %b %Y %H:%M")
-    history.sort(key=lambda x: x["date"])
+        revision["date"] = parse_revision_date(revision["date"])
+    history.sort(key=itemgetter("date"))
     return history
 
 
-def get_wiki_source(page_id, domain, attempts=5):
+def add_history_fields(record):
+    # Converts the history dict to a list sorted by date, and adds who made the first and last edits and when.
+    record["history"] = process_history(record["history"])
+    record["revision_count"] = len(record["history"])
 
-    try:
-        response = httpx.post(
-            f"https://{domain}/ajax-module-connector.php",
-            data={
-                "wikidot_token7": MAIN_TOKEN,
-                "page_id": str(page_id),
-                "moduleName": "viewsource/ViewSourceModule",
-            },
-            cookies={"wikidot_token7": MAIN_TOKEN},
-        )
-        response.raise_for_status()
-    except:
-        print(f"Failed to load source for {page_id}")
-        attempts -= 1
-        if attempts > 0:
-            print(f"Sleeping before retry- {attempts} attempts remaining.")
-            time.sleep(1)
-            return get_wiki_source(page_id, domain, attempts=attempts)
-        return False
+    if len(record["history"]) > 0:
+        record["created_at"] = record["history"][0]["date"]
+        record["creator"] = record["history"][0]["author"]
+        record["last_edited_at"] = record["history"][-1]["date"]
+        record["last_editor"] = record["history"][-1]["author"]
+    else:
+        record["created_at"] = "unknown"
+        record["creator"] = "unknown"
+        record["last_edited_at"] = "unknown"
+        record["last_editor"] = "unknown"
 
-    try:
-        page_response = response.json()
-        soup = BeautifulSoup(page_response["body"], "lxml")
-        raw_source = "".join(str(x) for x in soup.find("div", {"class": "page-source"}).contents)
-        return re.sub("<br\s*?/?\s*?>", "\n", html.unescape(raw_source), flags=re.IGNORECASE)
-    except:
-        print(f"Unable to pull body for wikisource from {page_id}")
-        return None
 
+def process_item(item):
+    item["images"] = get_images(item["raw_content"])
+    add_text_fields(item)
+    add_history_fields(item)
+    return item
 
 
-print("Processing Hub list.")
+def process_tale(tale):
+    tale["images"] = get_images(tale["raw_content"])
+    add_text_fields(tale)
+    add_history_fields(tale)
+    tale["year"] = tale["created_at"].year if tale["history"] else "unknown"
+    return tale
 
-hub_list = from_file(cwd + "/data/scp_hubs.json")
-hub_items = {}
-hub_references = {}
-for hub in tqdm(
-    hub_list,
-):
-    # Convert history dict to list and sort by date.
-    hub["history"] = process_history(hub["history"])
 
-    if len(hub["history"]) > 0:
-        hub["created_at"] = hub["history"][0]["date"]
-        hub["creator"] = hub["history"][0]["author"]
-    else:
-        hub["created_at"] = "unknown"
-        hub["creator"] = "unknown"
+def process_goi(tale):
+    tale["images"] = get_images(tale["raw_content"])
+    add_text_fields(tale)
+    add_history_fields(tale)
+    return tale
 
-    hub_items[hub["link"]] = hub
-    hub_references[hub["link"]] = set(hub["references"])
 
-hub_dir = Path(cwd + "/data/processed/hubs")
-os.makedirs(hub_dir, exist_ok=True)
-to_file(hub_items, hub_dir / "index.json")
+def iter_batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def get_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+
+def map_records(
+    function,
+    records,
+    workers=DEFAULT_WORKERS,
+    pool=None,
+    chunksize=DEFAULT_CHUNKSIZE,
+    detach=("raw_source",),
+):
+    # Applies `function` to every record and yields the results in order.
+    #
+    # With more than one worker the records go through a process pool in chunks, and the next batch is submitted
+    # before the current one is handed back so the pool stays busy. Fields in `detach` are not needed by the workers
+    # so they stay in this process instead of being copied over and back. Pass `pool` to share one pool between
+    # several stages.
+    if workers <= 1:
+        yield from map(function, records)
+        return
+
+    if pool is None:
+        with get_pool(workers) as pool:
+            yield from map_records(function, records, workers, pool, chunksize, detach)
+        return
+
+    pending = None
+    for batch in iter_batches(records, workers * chunksize * 4):
+        detached = [{field: record.pop(field) for field in detach if field in record} for record in batch]
+        results = pool.map(function, batch, chunksize=chunksize)
+        if pending is not None:
+            yield from reattach_fields(*pending)
+        pending = (results, detached)
+    if pending is not None:
+        yield from reattach_fields(*pending)
+
+
+def reattach_fields(results, detached):
+    for record, fields in zip(results, detached):
+        record.update(fields)
+        yield record
+
+
+def get_source_fetcher(concurrency, rate_limit, source_cache):
+    cache = SourceCache(source_cache) if source_cache else None
+    return SourceFetcher(concurrency=concurrency, rate_limit=rate_limit, cache=cache)
+
+
+def process_hub(hub):
+    add_text_fields(hub)
+    add_history_fields(hub)
+    return hub
+
+
+def is_stale(output, *inputs):
+    if not os.path.exists(output):
+        return True
+    output_time = os.path.getmtime(output)
+    return any(os.path.getmtime(path) > output_time for path in inputs)
+
+
+def process_hubs(workers=DEFAULT_WORKERS, force=False, pool=None):
+    # Processed hubs are memoized on disk and only rebuilt when one of the crawls is newer than them.
+    hub_feed = cwd + "/data/scp_hubs.jsonl"
+    hub_path = Path(cwd + "/data/processed/hubs") / "index.json"
+    # The index is left alone when no hub changed, so the hashes file is what records when this last ran. The graph
+    # fields depend on every crawl, so any of them changing means the hubs are rebuilt.
+    graph_feeds = [path for path in get_graph_feeds() if os.path.exists(path)]
+    if not force and hub_path.exists() and not is_stale(hub_path.parent / HASHES_FILE, hub_feed, *graph_feeds):
+        print(f"Processed hubs in {hub_path} are up to date.")
+        clear_changes(hub_path.parent)
+        return hub_path
+
+    print("Processing Hub list.")
+    os.makedirs(hub_path.parent, exist_ok=True)
+    with ShardedJsonWriter(hub_path.parent, default=json_serial) as writers, TextCache(TEXT_CACHE) as text_cache:
+        index = writers.get_writer(hub_path.name)
+        hubs = map_records(process_hub, text_cache.iter_cached(iter_records(hub_feed)), workers=workers, pool=pool)
+        for hub in tqdm(text_cache.iter_stored(hubs)):
+            hub.update(get_graph_fields(hub["link"]))
+            index.write(hub["link"], hub)
+    return hub_path
+
+
+@functools.cache
+def get_hub_index():
+    # Hub membership only needs each hub's references, so this reads the crawl directly rather than waiting on the
+    # processed hubs.
+    return ReferenceIndex.from_records(iter_records(cwd + "/data/scp_hubs.jsonl"))
 
 
 def get_hubs(link):
-    in_hubs = []
-    for hub_name, hub_links in hub_references.items():
-        if link in hub_links:
-            in_hubs.append(hub_name)
-    return in_hubs
+    # Sorted rather than in crawl order, which changes from one crawl to the next and would make every content
+    # file look changed.
+    return sorted(get_hub_index().referenced_by(link))
 
 
-@cli.command()
-def run_postproc_items():
-    processed_path = Path(cwd + "/data/processed/items")
-    os.makedirs(processed_path, exist_ok=True)
+def get_graph_feeds():
+    return [cwd + "/data/" + feed for feed in GRAPH_FEEDS]
 
-    title_list = from_file(cwd + "/data/scp_titles.json")
-    title_index = {title["link"]: title["title"] for title in title_list}
 
-    print("Processing Item list.")
+def iter_graph_records():
+    for path in get_graph_feeds():
+        if os.path.exists(path):
+            yield from iter_records(path)
 
-    item_list = from_file(cwd + "/data/scp_items.json")
-    items = {}
-    series_items = {}
-    for item in tqdm(item_list, smoothing=0):
-        if item["link"] in title_index:
-            item["title"] = title_index[item["link"]]
-        else:
-            item["title"] = item["scp"]
 
-        item["raw_source"] = get_wiki_source(item["page_id"], item["domain"])
-        item["images"] = get_images(item["raw_content"])
-        item["hubs"] = get_hubs(item["link"])
+@functools.cache
+def get_reference_graph():
+    # Like the hub index this only needs the references from each crawl.
+    return ReferenceGraph.from_records(iter_graph_records()).rank()
 
-        # Convert history dict to list and sort by date.
-        item["history"] = process_history(item["history"])
 
-        if len(item["history"]) > 0:
-            item["created_at"] = item["history"][0]["date"]
-            item["creator"] = item["history"][0]["author"]
+def get_graph_fields(link):
+    # Backlinks, degrees and PageRank change whenever any page does, so they only go in the indexes and never in
+    # the content shards, which would otherwise all be rewritten on every run.
+    return get_reference_graph().get_fields(link)
 
-        items[item["scp"]] = item
 
-        if item["series"].startswith("series-") and item["scp_number"] >= 5000:
-            if item["scp_number"] % 1000 > 500:
-                label = item["series"] + ".5"
-            else:
-                label = item["series"] + ".0"
-        else:
-            label = item["series"]
+def iter_processed(path, function, fetcher, workers=DEFAULT_WORKERS, pool=None):
+    # Crawl records with their wiki source attached and `function` applied, in crawl order.
+    with TextCache(TEXT_CACHE) as text_cache:
+        records = fetcher.iter_with_sources(iter_records(path))
+        records = map_records(function, text_cache.iter_cached(records), workers=workers, pool=pool)
+        yield from tqdm(text_cache.iter_stored(records), total=count_records(path), smoothing=0)
+        print(f"Reused the text of {text_cache.hits} unchanged pages.")
+
+
+def get_index_writer(writers):
+    # Index records get the `content_file` their content ended up in once every shard has been laid out.
+    return writers.get_writer("index.json", fields=lambda key: {"content_file": writers.get_content_file(key)})
+
+
+def write_content_indexes(writers, shards, shard_size, directory=None):
+    # `shards` maps each series or year to its content file. With size bounded shards one is spread over several
+    # files, so it gets a list of them.
+    content_index = {}
+    for label, filename in shards.items():
+        parts = [directory / part if directory else part for part in writers.get_parts(filename)]
+        content_index[label] = parts if shard_size else parts[0]
+    writers.write_object("content_lookup.json", writers.get_locations())
+    if shards:
+        writers.write_object("content_index.json", content_index)
+
+
+def postproc_items(fetcher, workers=DEFAULT_WORKERS, pool=None, shard_size=DEFAULT_SHARD_SIZE):
+    processed_path = Path(cwd + "/data/processed/items")
+    os.makedirs(processed_path, exist_ok=True)
+
+    title_index = {title["link"]: title["title"] for title in iter_records(cwd + "/data/scp_titles.jsonl")}
 
-        if label not in series_items:
-            series_items[label] = {}
-        series_items[label][item["scp"]] = item
+    print("Processing Item list.")
 
-    item_files = {}
     series_index = {}
-    for series, series_items in series_items.items():
-        filename = f"content_{series}.json"
-        series_index[series] = filename
-        to_file(series_items, processed_path / filename)
-        for item_key, item_value in series_items.items():
-            item_files[item_value["link"]] = filename
+    with ShardedJsonWriter(processed_path, default=json_serial, max_bytes=shard_size) as writers:
+        # Finished records are kept serialized rather than as objects until the index can be written.
+        index = get_index_writer(writers)
+        for item in iter_processed(cwd + "/data/scp_items.jsonl", process_item, fetcher, workers, pool):
+            if item["link"] in title_index:
+                item["title"] = title_index[item["link"]]
+            else:
+                item["title"] = item["scp"]
 
-    to_file(series_index, processed_path / "content_index.json")
+            item["hubs"] = get_hubs(item["link"])
+            graph_fields = get_graph_fields(item["link"])
+            label = get_series_label(item["series"], item["scp_number"])
 
-    for item_id in items:
-        del items[item_id]["raw_content"]
-        del items[item_id]["raw_source"]
-        items[item_id]["content_file"] = item_files[items[item_id]["link"]]
+            # Write the full record out now and only keep the metadata around for the index.
+            series_index[label] = f"content_{label}.json"
+            writers.write(series_index[label], item["scp"], item)
 
-    to_file(items, processed_path / "index.json")
+            del item["raw_content"]
+            del item["raw_source"]
+            del item["text"]
+            item.update(graph_fields)
+            index.write(item["scp"], item)
 
+        write_content_indexes(writers, series_index, shard_size)
 
-@cli.command()
-def run_postproc_tales():
 
+def postproc_tales(fetcher, workers=DEFAULT_WORKERS, pool=None, shard_size=DEFAULT_SHARD_SIZE):
     processed_path = Path(cwd + "/data/processed/tales")
     os.makedirs(processed_path, exist_ok=True)
 
     print("Processing Tale list.")
 
-    tale_list = from_file(cwd + "/data/scp_tales.json")
-    tales = {}
-    tale_years = {}
-    for tale in tqdm(tale_list, smoothing=0):
+    year_index = {}
+    with ShardedJsonWriter(processed_path, default=json_serial, max_bytes=shard_size) as writers:
+        index = get_index_writer(writers)
+        for tale in iter_processed(cwd + "/data/scp_tales.jsonl", process_tale, fetcher, workers, pool):
+            tale["hubs"] = get_hubs(tale["link"])
+            graph_fields = get_graph_fields(tale["link"])
+            tale["link"] = tale["url"].replace("https://scp-wiki.wikidot.com/", "")
 
-        tale["images"] = get_images(tale["raw_content"])
-        tale["hubs"] = get_hubs(tale["link"])
-        tale["raw_source"] = get_wiki_source(tale["page_id"], tale["domain"])
+            year_index[tale["year"]] = f"content_{tale['year']}.json"
+            writers.write(year_index[tale["year"]], tale["link"], tale)
 
-        # Convert history dict to list and sort by date.
-        tale["history"] = process_history(tale["history"])
+            del tale["raw_content"]
+            del tale["raw_source"]
+            del tale["text"]
+            tale.update(graph_fields)
+            index.write(tale["link"], tale)
 
-        if len(tale["history"]) > 0:
-            tale["created_at"] = tale["history"][0]["date"]
-            tale["creator"] = tale["history"][0]["author"]
-            tale["year"] = tale["created_at"].year
-        else:
-            tale["created_at"] = "unknown"
-            tale["creator"] = "unknown"
-            tale["year"] = "unknown"
+        write_content_indexes(writers, year_index, shard_size, processed_path)
 
-        tale["link"] = tale["url"].replace("https://scp-wiki.wikidot.com/", "")
-        tales[tale["link"]] = tale
 
-        if tale["year"] not in tale_years:
-            tale_years[tale["year"]] = {}
-        tale_years[tale["year"]][tale["link"]] = tale
+def postproc_goi(fetcher, workers=DEFAULT_WORKERS, pool=None, shard_size=DEFAULT_SHARD_SIZE):
+    processed_path = Path(cwd + "/data/processed/goi")
+    os.makedirs(processed_path, exist_ok=True)
 
-    year_index = {}
-    for year in tale_years:
-        filename = processed_path / f"content_{year}.json"
-        year_index[year] = filename
-        to_file(tale_years[year], filename)
-    to_file(year_index, processed_path / f"content_index.json")
+    print("Processing GOI list.")
+
+    with ShardedJsonWriter(processed_path, default=json_serial, max_bytes=shard_size) as writers:
+        index = get_index_writer(writers)
+        for tale in iter_processed(cwd + "/data/goi.jsonl", process_goi, fetcher, workers, pool):
+            tale["hubs"] = get_hubs(tale["link"])
+            graph_fields = get_graph_fields(tale["link"])
+            tale["link"] = tale["url"].replace("https://scp-wiki.wikidot.com/", "")
+            writers.write("content_goi.json", tale["link"], tale)
+
+            del tale["raw_content"]
+            del tale["raw_source"]
+            del tale["text"]
+            tale.update(graph_fields)
+            index.write(tale["link"], tale)
+
+        # GOI formats all go in one file, so there is no content index.
+        write_content_indexes(writers, {}, shard_size)
 
-    for tale_id in tales:
-        del tales[tale_id]["raw_content"]
-        del tales[tale_id]["raw_source"]
-        year = tales[tale_id]["year"]
-        tales[tale_id]["content_file"] = f"content_{year}.json"
 
-    to_file(tales, processed_path / "index.json")
+@contextmanager
+def timed_stage(name, timings):
+    print(f"Starting stage: {name}")
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+        print(f"Finished stage: {name} in {timings[name]:.2f}s")
 
 
 @cli.command()
-def run_postproc_goi():
+def run_postproc_hubs(workers: int = DEFAULT_WORKERS, force: bool = False):
+    process_hubs(workers=workers, force=force)
 
-    processed_path = Path(cwd + "/data/processed/goi")
-    os.makedirs(processed_path, exist_ok=True)
 
-    print("Processing GOI list.")
+@cli.command()
+def run_postproc_items(
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rate_limit: float = DEFAULT_RATE_LIMIT,
+    source_cache: str = SOURCE_CACHE,
+    workers: int = DEFAULT_WORKERS,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+):
+    with get_source_fetcher(concurrency, rate_limit, source_cache) as fetcher:
+        postproc_items(fetcher, workers=workers, shard_size=shard_size)
 
-    tale_list = from_file(cwd + "/data/goi.json")
-    tales = {}
-    for tale in tqdm(tale_list, smoothing=0):
 
-        tale["images"] = get_images(tale["raw_content"])
-        tale["hubs"] = get_hubs(tale["link"])
-        tale["raw_source"] = get_wiki_source(tale["page_id"], tale["domain"])
+@cli.command()
+def run_postproc_tales(
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rate_limit: float = DEFAULT_RATE_LIMIT,
+    source_cache: str = SOURCE_CACHE,
+    workers: int = DEFAULT_WORKERS,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+):
+    with get_source_fetcher(concurrency, rate_limit, source_cache) as fetcher:
+        postproc_tales(fetcher, workers=workers, shard_size=shard_size)
 
-        # Convert history dict to list and sort by date.
-        tale["history"] = process_history(tale["history"])
 
-        if len(tale["history"]) > 0:
-            tale["created_at"] = tale["history"][0]["date"]
-            tale["creator"] = tale["history"][0]["author"]
-        else:
-            tale["created_at"] = "unknown"
-            tale["creator"] = "unknown"
+@cli.command()
+def run_postproc_goi(
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rate_limit: float = DEFAULT_RATE_LIMIT,
+    source_cache: str = SOURCE_CACHE,
+    workers: int = DEFAULT_WORKERS,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+):
+    with get_source_fetcher(concurrency, rate_limit, source_cache) as fetcher:
+        postproc_goi(fetcher, workers=workers, shard_size=shard_size)
 
-        tale["link"] = tale["url"].replace("https://scp-wiki.wikidot.com/", "")
-        tales[tale["link"]] = tale
 
-    to_file(tales, processed_path / f"content_goi.json")
+@cli.command()
+def run_all(
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rate_limit: float = DEFAULT_RATE_LIMIT,
+    source_cache: str = SOURCE_CACHE,
+    workers: int = DEFAULT_WORKERS,
+    force: bool = False,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+):
+    # Runs every postprocessing stage in one process, sharing the hub index, source cache, HTTP client and worker
+    # pool between the content types.
+    timings = {}
+    pool_context = get_pool(workers) or nullcontext()
+    with pool_context as pool, get_source_fetcher(concurrency, rate_limit, source_cache) as fetcher:
+        with timed_stage("hubs", timings):
+            process_hubs(workers=workers, force=force, pool=pool)
+        with timed_stage("references", timings):
+            get_hub_index()
+            get_reference_graph()
+        with timed_stage("items", timings):
+            postproc_items(fetcher, workers=workers, pool=pool, shard_size=shard_size)
+        with timed_stage("tales", timings):
+            postproc_tales(fetcher, workers=workers, pool=pool, shard_size=shard_size)
+        with timed_stage("goi", timings):
+            postproc_goi(fetcher, workers=workers, pool=pool, shard_size=shard_size)
+        if fetcher.cache is not None:
+            # Every page has been seen at this point, so anything else in the cache was deleted from the wiki.
+            print(f"Evicted {fetcher.cache.evict_unseen()} deleted pages from the source cache.")
+
+    print("Stage timings:")
+    for name, seconds in timings.items():
+        print(f"  {name:<12} {seconds:8.2f}s")
+    print(f"  {'total':<12} {sum(timings.values()):8.2f}s")
 
-    for tale_id in tales:
-        del tales[tale_id]["raw_content"]
-        del tales[tale_id]["raw_source"]
-        tales[tale_id]["content_file"] = f"content_goi.json"
 
-    to_file(tales, processed_path / "index.json")
+@cli.command()
+def run_export_parquet(processed: str = cwd + "/data/processed", output: str = cwd + "/data/parquet"):
+    # Needs the optional pyarrow dependency, `pip install .[parquet]`.
+    export_parquet(processed, output)
+
+
+@cli.command()
+def run_export_sqlite(processed: str = cwd + "/data/processed", database: str = DATABASE):
+    build_database(processed, database)
+
+
+@cli.command()
+def query(
+    text: str = typer.Argument(None),
+    tag: str = None,
+    author: str = None,
+    hub: str = None,
+    page_type: str = typer.Option(None, "--type"),
+    limit: int = 20,
+    database: str = DATABASE,
+):
+    # Searches the database built by `run-export-sqlite`. Words in `text` are matched as they are, with AND, OR, NOT
+    # and a trailing `*` for prefixes. Put quotes or brackets in it to use SQLite's full text query syntax directly.
+    if not os.path.exists(database):
+        print(f"No database at {database}, run `run-export-sqlite` to build it.")
+        raise typer.Exit(1)
+    db = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    try:
+        results = search_pages(db, text, tag, author, hub, page_type, limit)
+    except sqlite3.OperationalError as error:
+        db.close()
+        print(f"Could not search for {text!r}: {error}")
+        print('Quote anything that isn\'t a plain word or AND, OR or NOT, like "scp-173" or "site-19"*.')
+        raise typer.Exit(1)
+    for result_type, key, title, rating, snippet in results:
+        print(f"{result_type:<6} {'-' if rating is None else rating:>6}  {key}  {title}")
+        if snippet:
+            print(f"{'':<14}{snippet}")
+    db.close()
 
 
 if __name__ == "__main__":
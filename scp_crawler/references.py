@@ -0,0 +1,141 @@
+from array import array
+from itertools import accumulate
+
+
+class ReferenceIndex:
+    # Inverted index from a referenced link to the pages that reference it.
+    #
+    # Lookups return sources in the order they were first added, which matches what a linear scan over the source
+    # pages would give. The same structure works for hubs referencing items, items referencing items, and so on.
+
+    def __init__(self, references=None):
+        self.references = {}
+        self.positions = {}
+        self.index = {}
+        if references:
+            for source, links in references.items():
+                self.add(source, links)
+
+    @classmethod
+    def from_records(cls, records, key="link"):
+        return cls({record[key]: record.get("references") or [] for record in records})
+
+    def add(self, source, links):
+        # Adding a source again replaces its references but keeps its original position.
+        self.remove(source)
+        if source not in self.positions:
+            self.positions[source] = len(self.positions)
+        links = set(links)
+        self.references[source] = links
+        for link in links:
+            if link not in self.index:
+                self.index[link] = []
+            self.index[link].append(source)
+
+    def remove(self, source):
+        for link in self.references.pop(source, ()):
+            self.index[link].remove(source)
+            if not self.index[link]:
+                del self.index[link]
+
+    def referenced_by(self, link):
+        if link not in self.index:
+            return []
+        return sorted(self.index[link], key=self.positions.__getitem__)
+
+    def references_from(self, source):
+        return self.references.get(source, set())
+
+    def __contains__(self, link):
+        return link in self.index
+
+    def __len__(self):
+        return len(self.references)
+
+
+class ReferenceGraph:
+    # Links between crawled pages, in compressed sparse row form. Page `i` links to the page ids in
+    # `targets[offsets[i]:offsets[i + 1]]`, and the transposed `sources`/`source_offsets` pair gives its backlinks.
+    # Only links between pages in the graph count, and a page linking to itself is ignored.
+
+    def __init__(self, references):
+        self.links = list(references)
+        self.ids = {link: page for page, link in enumerate(self.links)}
+
+        self.offsets = array("l", [0])
+        self.targets = array("l")
+        in_degrees = [0] * len(self.links)
+        for page, link in enumerate(self.links):
+            targets = sorted({self.ids[target] for target in references[link] if target in self.ids} - {page})
+            self.targets.extend(targets)
+            self.offsets.append(len(self.targets))
+            for target in targets:
+                in_degrees[target] += 1
+
+        self.source_offsets = array("l", accumulate(in_degrees, initial=0))
+        self.sources = array("l", bytes(self.targets.itemsize * len(self.targets)))
+        filled = array("l", self.source_offsets[:-1])
+        for page in range(len(self.links)):
+            for target in self.targets[self.offsets[page] : self.offsets[page + 1]]:
+                self.sources[filled[target]] = page
+                filled[target] += 1
+        self.ranks = None
+
+    @classmethod
+    def from_records(cls, records, key="link"):
+        # Pages can be crawled as more than one type (GOI formats are also tales), so their references are merged.
+        references = {}
+        for record in records:
+            references.setdefault(record[key], set()).update(record.get("references") or [])
+        return cls(references)
+
+    def out_degree(self, page):
+        return self.offsets[page + 1] - self.offsets[page]
+
+    def in_degree(self, page):
+        return self.source_offsets[page + 1] - self.source_offsets[page]
+
+    def backlinks(self, page):
+        # Sorted, so the order pages were crawled in doesn't change the index.
+        sources = self.sources[self.source_offsets[page] : self.source_offsets[page + 1]]
+        return sorted(self.links[source] for source in sources)
+
+    def get_pagerank(self, damping=0.85, iterations=100, tolerance=1e-10):
+        # Power iteration, pulling each page's new rank from its backlinks. Rank from pages without any links is
+        # spread evenly over every page, so the ranks always add up to 1.
+        count = len(self.links)
+        if not count:
+            return []
+        out_degrees = [self.out_degree(page) for page in range(count)]
+        dangling = [page for page in range(count) if not out_degrees[page]]
+        ranks = [1 / count] * count
+        for _ in range(iterations):
+            shares = [rank / degree if degree else 0.0 for rank, degree in zip(ranks, out_degrees)]
+            base = (1 - damping + damping * sum(ranks[page] for page in dangling)) / count
+            new_ranks = [
+                base + damping * sum(map(shares.__getitem__, self.sources[start:end]))
+                for start, end in zip(self.source_offsets, self.source_offsets[1:])
+            ]
+            change = sum(abs(new - old) for new, old in zip(new_ranks, ranks))
+            ranks = new_ranks
+            if change < tolerance:
+                break
+        return ranks
+
+    def rank(self, **kwargs):
+        self.ranks = self.get_pagerank(**kwargs)
+        return self
+
+    def get_fields(self, link):
+        # Graph fields for one page, as stored in the processed indexes.
+        if link not in self.ids:
+            return {"backlinks": [], "in_degree": 0, "out_degree": 0, "pagerank": 0.0}
+        if self.ranks is None:
+            self.rank()
+        page = self.ids[link]
+        return {
+            "backlinks": self.backlinks(page),
+            "in_degree": self.in_degree(page),
+            "out_degree": self.out_degree(page),
+            "pagerank": float(f"{self.ranks[page]:.8g}"),
+        }
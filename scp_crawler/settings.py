@@ -34,6 +34,13 @@ CONCURRENT_REQUESTS = 8
 CONCURRENT_REQUESTS_PER_DOMAIN = CONCURRENT_REQUESTS
 # CONCURRENT_REQUESTS_PER_IP = 16
 
+# Per endpoint budgets for EndpointThrottleMiddleware. Each endpoint backs off on its own when the wiki returns a
+# 503 or 429, and CONCURRENT_REQUESTS still caps the total.
+ENDPOINT_CONCURRENCY = {"page": CONCURRENT_REQUESTS, "ajax": 4, "tags": 1}
+ENDPOINT_DELAY = {"page": 0, "ajax": 0, "tags": 1.0}
+ENDPOINT_MAX_DELAY = 60
+ENDPOINT_RECOVERY = 20
+
 # Disable cookies (enabled by default)
 COOKIES_ENABLED = True
 
@@ -57,20 +64,26 @@ COOKIES_ENABLED = True
 DOWNLOADER_MIDDLEWARES = {
     # 'scp_crawler.middlewares.ScpCrawlerDownloaderMiddleware': 543,
     "scrapy.downloadermiddlewares.cookies.CookiesMiddleware": 100,
+    # Sits closer to the downloader than RetryMiddleware (550) so it sees 503s before they are turned into retries.
+    "scp_crawler.middlewares.EndpointThrottleMiddleware": 560,
     "scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware": 900,
 }
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-# EXTENSIONS = {
-#    'scrapy.extensions.telnet.TelnetConsole': None,
-# }
+EXTENSIONS = {
+    # 'scrapy.extensions.telnet.TelnetConsole': None,
+    # Only active when a JOBDIR is set.
+    "scp_crawler.extensions.CrawlCheckpoint": 500,
+}
+CHECKPOINT_INTERVAL = 60
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-# ITEM_PIPELINES = {
-#    'scp_crawler.pipelines.ScpCrawlerPipeline': 300,
-# }
+ITEM_PIPELINES = {
+    # 'scp_crawler.pipelines.ScpCrawlerPipeline': 300,
+    "scp_crawler.pipelines.DedupePipeline": 100,
+}
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -91,10 +104,13 @@ AUTOTHROTTLE_TARGET_CONCURRENCY = CONCURRENT_REQUESTS_PER_DOMAIN
 # HTTPCACHE_EXPIRATION_SECS = 0
 # HTTPCACHE_DIR = 'httpcache'
 # HTTPCACHE_IGNORE_HTTP_CODES = []
-# HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+HTTPCACHE_STORAGE = "scp_crawler.httpcache.SqliteCacheStorage"
+HTTPCACHE_POLICY = "scp_crawler.httpcache.WikiCachePolicy"
+# Seconds each type of page ("index", "tags", "page" or "ajax") stays fresh, on top of `httpcache.DEFAULT_TTL`.
+HTTPCACHE_TTL = {}
 
 DIRECTORY = "data"
-FEED_FORMAT = "json"
-FEED_URL = f"{DIRECTORY}/%(name)s.json"
+FEED_FORMAT = "jsonlines"
+FEED_URL = f"{DIRECTORY}/%(name)s.jsonl"
 
 RETRY_TIMES = 20
@@ -1,20 +1,40 @@
+import copy
+import io
+import json
+import os
 import re
 import sys
+from datetime import datetime, timedelta, timezone
 from pprint import pprint
 
+import lxml.etree
+import lxml.html
 import requests
 import scrapy
 from bs4 import BeautifulSoup
+from scrapy import signals
+from scrapy.exceptions import CloseSpider, DontCloseSpider
 from scrapy.linkextractors import LinkExtractor
 from scrapy.spiders import CrawlSpider, Rule
 
+from .. import classification
+from ..feeds import iter_records
 from ..items import ScpGoi, ScpHub, ScpItem, ScpTale, ScpTitle
 
 DOMAIN = "scp-wiki.wikidot.com"
 INT_DOMAIN = "scp-int.wikidot.com"
 MAX_HISTORY_PAGES = 5
+HISTORY_PER_PAGE = 99999
+# Revisions asked for at a time when the earlier history of a page is already known.
+HISTORY_DELTA_PER_PAGE = 20
 MAIN_TOKEN = "123456"
 
+CHANGES_PER_PAGE = 100
+MAX_CHANGES_PAGES = 500
+# Recent changes are requested from a little before the newest revision we know about, in case that crawl was
+# still running while pages were being edited.
+INCREMENTAL_OVERLAP = timedelta(days=1)
+
 
 class WikiMixin:
 
@@ -24,60 +44,134 @@ class WikiMixin:
         "/licensing-master-list",
     ]
 
-    def parse_history(self, response, item, history_page=1):
+    # Name of the callback that turns a page into items, for pages scheduled outside of the crawl rules.
+    page_callback = None
+
+    # Feeds from an earlier crawl, comma separated, whose page histories are reused so that only revisions made since
+    # then get downloaded (`-a history_from=data/scp_items.jsonl`). Incremental crawls use their `previous` feed.
+    history_from = None
+
+    def parse_known_page(self, response, **kwargs):
+        # Like CrawlSpider rules, treat a `False` from the page callback as "not one of ours".
+        return getattr(self, self.page_callback)(response, **kwargs) or ()
+
+    def get_known_history(self, page_id):
+        if not hasattr(self, "known_history"):
+            self.known_history = self.load_known_history()
+        return self.known_history.get(page_id)
+
+    def load_known_history(self):
+        paths = self.history_from or getattr(self, "previous", None)
+        if not paths:
+            return {}
+        known_history = {}
+        for path in paths.split(","):
+            for record in iter_records(path):
+                # Postprocessed feeds have already turned the history into a list, and can't be used.
+                if isinstance(record.get("history"), dict):
+                    known_history[record["page_id"]] = record["history"]
+        self.logger.info(f"Loaded the history of {len(known_history)} pages from {paths}")
+        return known_history
+
+    def get_page_history_request(self, response, item, related=()):
+        if "history" in response.meta:
+            # A page refetched because its cached copy was out of date, which already has its history.
+            item["history"] = response.meta["history"]
+            return self.get_page_source_request(item["page_id"], item, related)
+
+        # Pages served from the HTTP cache have their revision checked against the history once it is in.
+        cached_revision = self.get_revision(response) if "cached" in response.flags else None
+
+        known = self.get_known_history(item["page_id"])
+        if not known:
+            return self.get_history_request(item["page_id"], 1, item, related, cached_revision)
+
+        item["history"] = dict(known)
+        known_revision = get_newest_revision(known)
+        revision = self.get_revision(response)
+        if cached_revision is None and revision is not None and revision <= known_revision:
+            # Nothing has been edited since the earlier crawl.
+            return self.get_page_source_request(item["page_id"], item, related)
+        return self.get_history_request(item["page_id"], 1, item, related, cached_revision, known_revision)
+
+    def parse_history(self, response, item, history_page=1, related=(), cached_revision=None, known_revision=None):
         self.logger.info(f"Reviewing Page {item['page_id']} history")
 
         page_id = item["page_id"]
         changes = item["history"] if "history" in item else {}
+        reached_known = reached_first = False
         try:
-            history = response.json()
-            soup = BeautifulSoup(history["body"], "lxml")
-            rows = soup.table.find_all("tr")
+            body = response.json()["body"]
+            if "<table" not in body:
+                raise ValueError("No history table in response.")
+            # Revisions are listed newest first, so stop at the first one the earlier crawl already had.
+            for change_id, change in self.iter_history(body):
+                if known_revision is not None and change_id.isdigit() and int(change_id) <= known_revision:
+                    reached_known = True
+                    break
+                changes[change_id] = change
+                reached_first = reached_first or change_id == "0"
         except:
             self.logger.exception(f"Unable to parse history lookup. {item['url']}")
-            return self.get_page_source_request(page_id, item)
-        for row in rows:
+            item["history"] = changes
+            return self.get_page_source_request(page_id, item, related, cached_revision)
+
+        item["history"] = changes
+        # The "0" change is the first revision, and the last one that shows up. It has to come from this response, as
+        # a known history already has one.
+        if reached_known or reached_first:
+            return self.get_page_source_request(page_id, item, related, cached_revision)
+
+        if known_revision is not None:
+            # Edited too often since the earlier crawl to bridge the gap with short pages, so the whole history is
+            # fetched again rather than leaving a hole in it that later crawls would never fill.
+            self.logger.info(f"History of {item['url']} has more new revisions than expected, fetching all of it")
+            item["history"] = {}
+            return self.get_history_request(page_id, 1, item, related, cached_revision)
+
+        next_page = history_page + 1
+        if next_page > MAX_HISTORY_PAGES:
+            self.logger.warning(f"Failed to retrieve complete history for {item['url']}")
+            return self.get_page_source_request(page_id, item, related, cached_revision)
+
+        return self.get_history_request(page_id, next_page, item, related, cached_revision, known_revision)
+
+    def iter_history(self, body):
+        # Reads the rows of a history table one at a time with lxml, freeing each one once it is read, so a caller
+        # that stops early never parses the rest of the table.
+        rows = lxml.etree.iterparse(io.BytesIO(body.encode()), events=("end",), tag="tr", html=True, encoding="utf-8")
+        for _, row in rows:
             try:
-                if not "id" in row.attrs:
+                if "id" not in row.attrib:
                     continue
-                columns = row.find_all("td")
-                change_id = columns[0].text.replace(".", "").strip()
+                columns = row.findall(".//td")
+                change_id = get_element_text(columns[0]).replace(".", "").strip()
 
-                if "deleted" in row.text:
+                if "deleted" in get_element_text(row):
                     change_author = "deleted"
                     change_author_href = False
                 else:
-                    change_author = columns[4].text.strip()
-                    change_author_href = columns[4].span.a["href"].strip()
+                    change_author = get_element_text(columns[4]).strip()
+                    change_author_href = columns[4].xpath("(.//span)[1]//a/@href")[0].strip()
 
-                change_date = columns[5].text.strip()
-                change_comment = columns[6].text
-                changes[change_id] = {
+                change = {
                     "author": change_author,
                     "author_href": change_author_href,
-                    "date": change_date,
-                    "comment": change_comment,
+                    "date": get_element_text(columns[5]).strip(),
+                    "comment": get_element_text(columns[6]),
                 }
             except:
                 self.logger.exception("Could not process row.")
-                self.logger.error(row)
-
-            item["history"] = changes
-            # The "0" change is the first revision, and the last one that shows up.
-            # If we have it then we're done.
-            if "0" in changes:
-                return self.get_page_source_request(page_id, item)
-
-        next_page = history_page + 1
-        if next_page > MAX_HISTORY_PAGES:
-            self.logger.warning(f"Failed to retrieve complete history for {item['url']}")
-            return self.get_page_source_request(page_id, item)
-
-        return self.get_history_request(page_id, history_page + 1, item)
-
-    def get_history_request(self, page_id, history_page, item):
-        # return self.get_page_source_request(page_id=page_id, item=item)
-
+                self.logger.error(lxml.etree.tostring(row, encoding="unicode"))
+                continue
+            finally:
+                row.clear()
+            yield change_id, change
+
+    def get_history_request(self, page_id, history_page, item, related=(), cached_revision=None, known_revision=None):
+        # `related` are other items built from the same page. They get a copy of this item's history once it is
+        # complete, and travel with the request so they survive a crawl being stopped and resumed. Pages with a known
+        # history only ask for a short page of the newest revisions.
         return scrapy.http.FormRequest(
             url=f"https://{self.domain}/ajax-module-connector.php",
             method="POST",
@@ -86,18 +180,38 @@ class WikiMixin:
                 "page_id": str(page_id),
                 "moduleName": "history/PageRevisionListModule",
                 "page": str(history_page),
-                "perpage": str(99999),
+                "perpage": str(HISTORY_PER_PAGE if known_revision is None else HISTORY_DELTA_PER_PAGE),
             },
             cookies={"wikidot_token7": MAIN_TOKEN},
             callback=self.parse_history,
             cb_kwargs={
                 "item": item,
                 "history_page": history_page,
+                "related": related,
+                "cached_revision": cached_revision,
+                "known_revision": known_revision,
             },
         )
 
-    def get_page_source_request(self, page_id, item):
+    def get_page_source_request(self, page_id, item, related=(), cached_revision=None):
+        if cached_revision is not None and get_newest_revision(item.get("history")) > cached_revision:
+            # The cached copy of the page is older than its history, so build the items again from a fresh copy.
+            self.logger.info(f"Cached copy of {item['url']} is out of date, fetching it again")
+            link = item["link"]
+            return scrapy.http.Request(
+                url=item["url"],
+                callback=self.parse_known_page,
+                cb_kwargs={"original_link": link} if link != self.get_simple_link(item["url"]) else {},
+                meta={"cache_refresh": True, "history": item["history"]},
+                dont_filter=True,
+            )
+
         # Getting source in preprocessing phase
+        if related:
+            for other in related:
+                if "history" in item:
+                    other["history"] = item["history"]
+            return [item, *related]
         return item
         return scrapy.http.FormRequest(
             url=f"https://{self.domain}/ajax-module-connector.php",
@@ -132,6 +246,10 @@ class WikiMixin:
     def get_page_id(self, response):
         return re.search(r"WIKIREQUEST\.info\.pageId\s+=\s+(\d+);", response.text)[1]
 
+    def get_revision(self, response):
+        match = re.search(r"page revision:\s*(\d+)", "".join(response.css("#page-info ::text").getall()))
+        return int(match[1]) if match else None
+
     def get_tags(self, response):
         return response.css(".page-tags a::text").getall()
 
@@ -146,7 +264,7 @@ class WikiMixin:
         return title
 
     def get_simple_link(self, url):
-        return url.replace(f"http://{self.domain}/", "").replace(f"https://{self.domain}/", "")
+        return classification.get_simple_link(url, self.domain)
 
     def get_content_references(self, response):
         current_link = self.get_simple_link(response.url)
@@ -175,7 +293,286 @@ class WikiMixin:
         return False
 
 
-class ScpSpider(CrawlSpider, WikiMixin):
+# Builders for each type of page. They assume the page has already been checked as being of their type, and return
+# the item without its history so the caller decides how that gets fetched.
+class ItemPageMixin:
+    def validate(self, tags):
+        if "scp" not in tags:
+            return False
+        if "tale" in tags:
+            return False
+        return True
+
+    def build_item(self, response, tags, original_link=None):
+        self.logger.info("Processing SCP Item page: %s", response.url)
+
+        item = ScpItem()
+        item["title"] = self.get_title(response)
+        item["url"] = response.url
+        item["domain"] = self.domain
+        item["link"] = original_link if original_link else self.get_simple_link(response.url)
+        item["tags"] = tags
+        item["page_id"] = self.get_page_id(response)
+        item["scp"] = self.get_scp_identifier(item).upper()
+        item["scp_number"] = self.get_scp_number(item)
+        item["series"] = self.get_series(item)
+
+        if item["scp_number"] == 2721:
+            # Editorial choice- this SCP was locked due to trolls
+            item["rating"] = 200
+        else:
+            item["rating"] = get_rating(response)
+
+        item["raw_content"] = clean_content(response)
+        item["references"] = self.get_content_references(response)
+        return item
+
+    def get_scp_identifier(self, item):
+        return classification.get_scp_identifier(item["url"], item["tags"])
+
+    def get_scp_number(self, item):
+        return classification.get_scp_number(item["scp"])
+
+    def get_series(self, item):
+        return classification.get_series(item["scp"], item["tags"])
+
+
+class TalePageMixin:
+    def build_tale(self, response, tags, original_link=None):
+        self.logger.info("Processing SCP Tale page: %s", response.url)
+
+        item = ScpTale()
+        item["title"] = response.css("title::text").get()
+        item["url"] = response.url
+        item["domain"] = self.domain
+        item["link"] = original_link if original_link else self.get_simple_link(response.url)
+        item["tags"] = tags
+        item["page_id"] = self.get_page_id(response)
+        item["rating"] = get_rating(response)
+        item["raw_content"] = clean_content(response)
+        item["references"] = self.get_content_references(response)
+        return item
+
+
+class HubPageMixin:
+    excluded_hubs = [
+        "/new-pages-feed",
+        "/shortest-pages-this-month",
+        "/top-rated-pages-this-month",
+        "/user-curated-lists",
+        "/curated-tale-series",
+        "/foundation-tales",
+        "/groups-of-interest",
+        "/canon-hub",
+        "/young-and-under-30",
+        "/tales-by-title",
+        "/tales-by-author",
+    ]
+
+    def is_hub(self, link, tags):
+        if not "hub" in tags:
+            return False
+        if link in self.excluded_hubs:
+            self.logger.debug(f"Skipping hub at {link}")
+            return False
+        if link.startswith("/scp-series"):
+            return False
+        return True
+
+    def build_hub(self, response, tags, content):
+        item = ScpHub()
+        item["title"] = self.get_title(response)
+        item["url"] = response.url
+        item["domain"] = self.domain
+        item["link"] = self.get_simple_link(response.url)
+        item["tags"] = tags
+        item["page_id"] = self.get_page_id(response)
+        item["references"] = self.get_content_references(response)
+        item["raw_content"] = content
+        return item
+
+
+class GoiPageMixin:
+    def build_goi(self, response, tags, original_link=None):
+        self.logger.info("Processing SCP GOI page: %s", response.url)
+
+        item = ScpGoi()
+        item["title"] = response.css("title::text").get()
+        item["url"] = response.url
+        item["domain"] = self.domain
+        item["link"] = original_link if original_link else self.get_simple_link(response.url)
+        item["tags"] = tags
+        item["page_id"] = self.get_page_id(response)
+        item["rating"] = get_rating(response)
+        item["raw_content"] = clean_content(response)
+        return item
+
+
+class IncrementalMixin:
+    # Run with `-a previous=data/scp_items.jsonl` to only fetch pages that appear in the wiki's recent changes since
+    # that crawl. Pages that were not changed are carried over from the previous output, so the new feed is still a
+    # complete dataset. `-a since=2024-01-01T00:00` overrides the detected timestamp of the previous crawl.
+    #
+    # Rating changes do not show up in the recent changes listing, so ratings are only refreshed for pages that
+    # were edited or retagged.
+    #
+    # If the recent changes can't be read the crawl closes as `changes_unavailable`, without carrying anything over.
+
+    previous = None
+    since = None
+
+    async def start(self):
+        if not self.previous:
+            async for request in super().start():
+                yield request
+            return
+
+        self.changes_since = self.get_changes_since()
+        self.changed_links = set()
+        # Kept in the job state when there is a JOBDIR, so a resumed crawl still knows what not to carry over.
+        state = getattr(self, "state", {})
+        self.scraped_links = state.setdefault("scraped_links", set())
+        self.scraped_page_ids = state.setdefault("scraped_page_ids", set())
+        self.carried_over = False
+        self.crawler.signals.connect(self.incremental_item_scraped, signal=signals.item_scraped)
+        self.crawler.signals.connect(self.incremental_spider_idle, signal=signals.spider_idle)
+
+        self.logger.info(f"Checking {self.previous} for changes since {self.changes_since}")
+        yield self.get_changes_request(1)
+
+    def get_changes_since(self):
+        if self.since:
+            since = datetime.fromisoformat(self.since)
+            return since if since.tzinfo else since.replace(tzinfo=timezone.utc)
+
+        newest = None
+        for record in iter_records(self.previous):
+            for revision in (record.get("history") or {}).values():
+                try:
+                    revision_date = datetime.strptime(revision["date"], "%d %b %Y %H:%M")
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if newest is None or revision_date > newest:
+                    newest = revision_date
+        if newest is None:
+            raise ValueError(f"Unable to find any revision dates in {self.previous}, pass `since` explicitly.")
+        return newest.replace(tzinfo=timezone.utc) - INCREMENTAL_OVERLAP
+
+    def get_changes_request(self, changes_page):
+        return scrapy.http.FormRequest(
+            url=f"https://{self.domain}/ajax-module-connector.php",
+            method="POST",
+            formdata={
+                "wikidot_token7": MAIN_TOKEN,
+                "moduleName": "changes/SiteChangesListModule",
+                "options": json.dumps({"all": True}),
+                "page": str(changes_page),
+                "perpage": str(CHANGES_PER_PAGE),
+            },
+            cookies={"wikidot_token7": MAIN_TOKEN},
+            callback=self.parse_changes,
+            errback=self.err_changes,
+            cb_kwargs={"changes_page": changes_page},
+            dont_filter=True,
+        )
+
+    def err_changes(self, failure):
+        self.logger.error(failure)
+        self.fail_changes(f"Unable to fetch page {failure.request.cb_kwargs['changes_page']} of the recent changes")
+
+    def fail_changes(self, message):
+        # Without the full list of changes, carrying over the previous records would quietly keep stale pages, so the
+        # crawl is closed without finishing.
+        self.carried_over = True
+        self.logger.error(f"{message}, not carrying over {self.previous}")
+        raise CloseSpider("changes_unavailable")
+
+    def parse_changes(self, response, changes_page):
+        try:
+            selector = scrapy.Selector(text=response.json()["body"])
+        except (KeyError, TypeError, ValueError):
+            self.fail_changes(f"Unable to read page {changes_page} of the recent changes")
+        rows = selector.css(".changes-list-item")
+        reached_end = len(rows) < CHANGES_PER_PAGE
+        for row in rows:
+            href = row.css("td.title a::attr(href)").get()
+            timestamp = re.search(r"time_(\d+)", row.css("td.mod-date .odate::attr(class)").get() or "")
+            if not href or not timestamp:
+                continue
+            if datetime.fromtimestamp(int(timestamp[1]), tz=timezone.utc) < self.changes_since:
+                reached_end = True
+                break
+            self.changed_links.add(self.get_simple_link(response.urljoin(href)))
+
+        if not reached_end:
+            if changes_page < MAX_CHANGES_PAGES:
+                yield self.get_changes_request(changes_page + 1)
+                return
+            self.logger.warning(
+                f"Stopped after {MAX_CHANGES_PAGES} pages of recent changes, older changes since {self.changes_since} "
+                "are missed"
+            )
+
+        self.logger.info(f"Found {len(self.changed_links)} changed pages since {self.changes_since}")
+        for link in sorted(self.changed_links):
+            yield scrapy.http.Request(url=f"https://{self.domain}/{link}", callback=self.parse_known_page)
+
+    def incremental_item_scraped(self, item, response, spider):
+        self.scraped_links.add(item["link"])
+        self.scraped_page_ids.add(item["page_id"])
+
+    def incremental_spider_idle(self, spider):
+        if self.carried_over:
+            return
+        self.carried_over = True
+        # Schedule one last callback to carry over the unchanged records now that every changed page is done.
+        self.crawler.engine.crawl(scrapy.http.Request("data:,", callback=self.carry_over_previous, dont_filter=True))
+        raise DontCloseSpider
+
+    def carry_over_previous(self, response):
+        carried = 0
+        for record in iter_records(self.previous):
+            # Changed pages that no longer qualify (ie were retagged) are dropped rather than carried over.
+            if record["link"] in self.changed_links or record["link"] in self.scraped_links:
+                continue
+            if record["page_id"] in self.scraped_page_ids:
+                continue
+            carried += 1
+            yield record
+        self.logger.info(f"Carried over {carried} unchanged records from {self.previous}")
+
+
+class TagDiscoveryMixin:
+    # Run with `-a discovery=tags` to build the list of pages up front from the wiki's tag listings, rather than
+    # following links and throwing away the pages that turn out to have the wrong tags. Every page a spider keeps has
+    # to carry one of its `discovery_tags`, so the listings cover everything the link crawl would find.
+
+    discovery = "links"
+    discovery_tags = ()
+
+    async def start(self):
+        if self.discovery == "links":
+            async for request in super().start():
+                yield request
+            return
+        if self.discovery != "tags":
+            raise ValueError(f"Unknown discovery mode {self.discovery}, expected `links` or `tags`.")
+
+        for tag in self.discovery_tags:
+            yield scrapy.http.Request(
+                url=f"https://{self.domain}/system:page-tags/tag/{tag}",
+                callback=self.parse_tag_listing,
+                cb_kwargs={"tag": tag},
+            )
+
+    def parse_tag_listing(self, response, tag):
+        links = response.css(".pages-list-item .title a::attr(href)").getall()
+        self.logger.info(f"Found {len(links)} pages tagged {tag}")
+        for href in links:
+            yield scrapy.http.Request(url=response.urljoin(href), callback=self.parse_known_page)
+
+
+class ScpSpider(IncrementalMixin, TagDiscoveryMixin, CrawlSpider, ItemPageMixin, WikiMixin):
     name = "scp"
 
     allowed_domains = [DOMAIN]
@@ -193,16 +590,12 @@ class ScpSpider(CrawlSpider, WikiMixin):
         Rule(LinkExtractor(allow=[r".*-proposal.*"]), callback="parse_item"),
     )
 
+    page_callback = "parse_item"
+    discovery_tags = ["scp"]
+
     # rules = (Rule(LinkExtractor(allow=[r"scp-\d{3,}(?:-[\w|\d]+)*"]), callback="parse_item"),)
     # start_urls = [f"https://scp-wiki.wikidot.com/scp-3318"]
 
-    def validate(self, tags):
-        if "scp" not in tags:
-            return False
-        if "tale" in tags:
-            return False
-        return True
-
     def parse_item(self, response, original_link=None):
         self.logger.debug("Reviewing Potential SCP Item page: %s", response.url)
         content = self.get_content(response)
@@ -218,68 +611,8 @@ class ScpSpider(CrawlSpider, WikiMixin):
         if not self.validate(tags):
             return False
 
-        self.logger.info("Processing SCP Item page: %s", response.url)
-        content_soup = BeautifulSoup(content, "lxml")
-
-        item = ScpItem()
-        item["title"] = self.get_title(response)
-        item["url"] = response.url
-        item["domain"] = self.domain
-        item["link"] = original_link if original_link else self.get_simple_link(response.url)
-        item["tags"] = tags
-        item["page_id"] = self.get_page_id(response)
-        item["scp"] = self.get_scp_identifier(item).upper()
-        item["scp_number"] = self.get_scp_number(item)
-        item["series"] = self.get_series(item)
-
-        if item["scp_number"] == 2721:
-            # Editorial choice- this SCP was locked due to trolls
-            item["rating"] = 200
-        else:
-            item["rating"] = get_rating(response)
-
-        item["raw_content"] = str(clean_content_soup(content_soup))
-        item["references"] = self.get_content_references(response)
-
-        return self.get_history_request(item["page_id"], 1, item)
-
-    def get_scp_identifier(self, item):
-        try:
-            return re.search("scp(?:-[\w|\d]*)?-\d{3,4}(?:-[\w|\d]*)?", item["url"])[0]
-        except:
-            pass
-        if "proposal" in item["url"] or "001-proposal" in item["tags"]:
-            return "scp-001"
-        if item["url"].endswith("taboo") and "4000" in item["tags"]:
-            return "scp-4000"
-        return "unknown"
-
-    def get_scp_number(self, item):
-        matches = re.findall(r"[0-9]+", item["scp"])
-        if matches:
-            return int(matches[0])
-        return 0
-
-    def get_series(self, item):
-        if item["scp"].lower().endswith("-j") or "joke" in item["tags"]:
-            return "joke"
-        if "proposal" in item["scp"] or item["scp"].lower() == "scp-001":
-            return "scp-001"
-        if item["scp"].lower().endswith("-d") or "decommissioned" in item["tags"]:
-            return "decommissioned"
-        if item["scp"].lower().endswith("-ex") or "explained" in item["tags"]:
-            return "explained"
-        if item["scp"].lower().endswith("-arc") or "archived" in item["tags"]:
-            return "archived"
-        if "international" in item["tags"]:
-            return "international"
-
-        number = self.get_scp_number(item)
-        for x in range(1, 20):
-            if number < x * 1000:
-                return f"series-{x}"
-
-        return "other"
+        item = self.build_item(response, tags, original_link)
+        return self.get_page_history_request(response, item)
 
 
 class ScpTitleSpider(CrawlSpider):
@@ -329,7 +662,7 @@ class ScpTitleSpider(CrawlSpider):
                 self.logger.error(listing)
 
 
-class ScpTaleSpider(CrawlSpider, WikiMixin):
+class ScpTaleSpider(IncrementalMixin, TagDiscoveryMixin, CrawlSpider, TalePageMixin, WikiMixin):
     name = "scp_tales"
 
     start_urls = [
@@ -346,6 +679,9 @@ class ScpTaleSpider(CrawlSpider, WikiMixin):
         Rule(LinkExtractor(allow=[r".*"]), callback="parse_tale"),
     )
 
+    page_callback = "parse_tale"
+    discovery_tags = ["tale"]
+
     def parse_tale(self, response, original_link=None):
         self.logger.debug("Reviewing Potential SCP Tale page: %s", response.url)
         content = response.css("#page-content").get()
@@ -360,23 +696,11 @@ class ScpTaleSpider(CrawlSpider, WikiMixin):
         if "tale" not in tags:
             return False
 
-        self.logger.info("Processing SCP Tale page: %s", response.url)
-        content_soup = BeautifulSoup(content, "lxml")
+        item = self.build_tale(response, tags, original_link)
+        return self.get_page_history_request(response, item)
 
-        item = ScpTale()
-        item["title"] = response.css("title::text").get()
-        item["url"] = response.url
-        item["domain"] = self.domain
-        item["link"] = original_link if original_link else self.get_simple_link(response.url)
-        item["tags"] = tags
-        item["page_id"] = self.get_page_id(response)
-        item["rating"] = get_rating(response)
-        item["raw_content"] = str(clean_content_soup(content_soup))
-        item["references"] = self.get_content_references(response)
-        return self.get_history_request(item["page_id"], 1, item)
 
-
-class ScpHubSpider(CrawlSpider, WikiMixin):
+class ScpHubSpider(IncrementalMixin, TagDiscoveryMixin, CrawlSpider, HubPageMixin, WikiMixin):
     name = "scp_hubs"
 
     start_urls = [f"https://{DOMAIN}/system:page-tags/tag/hub"]
@@ -393,29 +717,13 @@ class ScpHubSpider(CrawlSpider, WikiMixin):
         ),
     )
 
-    excluded_hubs = [
-        "/new-pages-feed",
-        "/shortest-pages-this-month",
-        "/top-rated-pages-this-month",
-        "/user-curated-lists",
-        "/curated-tale-series",
-        "/foundation-tales",
-        "/groups-of-interest",
-        "/canon-hub",
-        "/young-and-under-30",
-        "/tales-by-title",
-        "/tales-by-author",
-    ]
+    page_callback = "parse_hub"
+    discovery_tags = ["hub"]
 
     def parse_hub(self, response):
         tags = self.get_tags(response)
-        if not "hub" in tags:
-            return False
         link = self.get_simple_link(response.url)
-        if link in self.excluded_hubs:
-            self.logger.debug(f"Skipping hub at {link}")
-            return False
-        if link.startswith("/scp-series"):
+        if not self.is_hub(link, tags):
             return False
 
         self.logger.info("Reviewing Potential SCP Hub page: %s", response.url)
@@ -424,17 +732,8 @@ class ScpHubSpider(CrawlSpider, WikiMixin):
         if not content:
             return False
 
-        item = ScpHub()
-        item["title"] = self.get_title(response)
-        item["url"] = response.url
-        item["domain"] = self.domain
-        item["link"] = link
-        item["tags"] = tags
-        item["page_id"] = self.get_page_id(response)
-        item["references"] = self.get_content_references(response)
-        item["raw_content"] = content
-
-        return self.get_history_request(item["page_id"], 1, item)
+        item = self.build_hub(response, tags, content)
+        return self.get_page_history_request(response, item)
 
 
 class ScpIntSpider(ScpSpider):
@@ -487,7 +786,7 @@ class ScpIntTaleSpider(ScpTaleSpider):
     domain = INT_DOMAIN
 
 
-class GoiSpider(CrawlSpider, WikiMixin):
+class GoiSpider(IncrementalMixin, TagDiscoveryMixin, CrawlSpider, GoiPageMixin, WikiMixin):
     name = "goi"
 
     start_urls = [
@@ -504,6 +803,9 @@ class GoiSpider(CrawlSpider, WikiMixin):
         Rule(LinkExtractor(allow=[r".*"]), callback="parse_tale"),
     )
 
+    page_callback = "parse_tale"
+    discovery_tags = ["goi-format"]
+
     def parse_tale(self, response, original_link=None):
         self.logger.debug("Reviewing Potential SCP GOI page: %s", response.url)
         content = response.css("#page-content").get()
@@ -516,19 +818,91 @@ class GoiSpider(CrawlSpider, WikiMixin):
         if "goi-format" not in tags:
             return False
 
-        self.logger.info("Processing SCP GOI page: %s", response.url)
-        content_soup = BeautifulSoup(content, "lxml")
+        item = self.build_goi(response, tags, original_link)
+        return self.get_page_history_request(response, item)
 
-        item = ScpGoi()
-        item["title"] = response.css("title::text").get()
-        item["url"] = response.url
-        item["domain"] = self.domain
-        item["link"] = original_link if original_link else self.get_simple_link(response.url)
-        item["tags"] = tags
-        item["page_id"] = self.get_page_id(response)
-        item["rating"] = get_rating(response)
-        item["raw_content"] = str(clean_content_soup(content_soup))
-        return self.get_history_request(item["page_id"], 1, item)
+
+class ScpSiteSpider(
+    TagDiscoveryMixin, CrawlSpider, ItemPageMixin, TalePageMixin, HubPageMixin, GoiPageMixin, WikiMixin
+):
+    # Crawls items, tales, hubs and GOI formats in one pass. Each page is downloaded once and routed by its tags to
+    # every builder it qualifies for, and those items share a single history lookup. Items are split back out into
+    # the same feeds the separate spiders write, as `.part` files that `make site` renames once the crawl finished.
+    name = "scp_site"
+
+    start_urls = [
+        f"http://{DOMAIN}/",
+        f"http://{DOMAIN}/system:page-tags/tag/scp",
+        f"http://{DOMAIN}/tales-by-title",
+        f"http://{DOMAIN}/system:page-tags/tag/tale",
+        f"http://{DOMAIN}/goi-formats",
+        f"http://{DOMAIN}/system:page-tags/tag/goi-format",
+        f"http://{DOMAIN}/system:page-tags/tag/hub",
+    ]
+
+    allowed_domains = [DOMAIN]
+
+    domain = DOMAIN
+
+    rules = (
+        Rule(LinkExtractor(allow=[r"scp-series(?:-\d*)?", "scp-ex", re.escape("tales-by-title")])),
+        Rule(
+            # Tag pages other than the start pages slam the system and give 503s.
+            LinkExtractor(allow=[r".*"], deny=[r"system:page-tags.*", re.escape("tag-search")]),
+            callback="parse_page",
+        ),
+    )
+
+    page_callback = "parse_page"
+    discovery_tags = ["scp", "tale", "goi-format", "hub"]
+
+    custom_settings = {
+        "FEEDS": {
+            "data/scp_items.jsonl.part": {"format": "jsonlines", "item_classes": [ScpItem], "overwrite": True},
+            "data/scp_tales.jsonl.part": {"format": "jsonlines", "item_classes": [ScpTale], "overwrite": True},
+            "data/scp_hubs.jsonl.part": {"format": "jsonlines", "item_classes": [ScpHub], "overwrite": True},
+            "data/goi.jsonl.part": {"format": "jsonlines", "item_classes": [ScpGoi], "overwrite": True},
+        },
+    }
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        jobdir = settings.get("JOBDIR")
+        if jobdir and os.path.exists(os.path.join(jobdir, "requests.seen")):
+            # A resumed job adds to the feeds it already started rather than replacing them.
+            feeds = {uri: {**options, "overwrite": False} for uri, options in settings.getdict("FEEDS").items()}
+            settings.set("FEEDS", feeds, priority="spider")
+
+    def parse_page(self, response, original_link=None):
+        self.logger.debug("Reviewing page: %s", response.url)
+        content = self.get_content(response)
+        tags = self.get_tags(response)
+        if not content or not tags:
+            return False
+
+        redirect = self.follow_splash_redirects(response, tags, self.parse_page)
+        if redirect:
+            return redirect
+
+        items = []
+        if self.validate(tags):
+            items.append(self.build_item(response, tags, original_link))
+        if "tale" in tags:
+            items.append(self.build_tale(response, tags, original_link))
+        if "goi-format" in tags:
+            items.append(self.build_goi(response, tags, original_link))
+        if self.is_hub(self.get_simple_link(response.url), tags):
+            items.append(self.build_hub(response, tags, content))
+        if not items:
+            return False
+
+        return self.get_page_history_request(response, items[0], items[1:])
+
+
+def get_newest_revision(history):
+    revisions = [int(change_id) for change_id in (history or {}) if change_id.isdigit()]
+    return max(revisions, default=0)
 
 
 def get_rating(response):
@@ -539,6 +913,47 @@ def get_rating(response):
     return 0
 
 
+def get_element_text(element):
+    # Equivalent to BeautifulSoup's `.text`.
+    return "".join(element.itertext())
+
+
+CLEAN_CONTENT_XPATH = " | ".join(
+    [
+        # Footer
+        ".//div[contains(concat(' ', normalize-space(@class), ' '), ' footer-wikiwalk-nav ')]",
+        # Ratings Bar
+        ".//div[contains(concat(' ', normalize-space(@class), ' '), ' page-rate-widget-box ')]",
+    ]
+)
+
+# Text that BeautifulSoup's `get_text` counts, which leaves out scripts and styles.
+VISIBLE_TEXT_XPATH = "descendant::text()[not(ancestor::script or ancestor::style or ancestor::template)]"
+
+
+def clean_content(response):
+    # Same cleanup as `clean_content_soup`, but done with XPath on a copy of the tree the response has already
+    # parsed instead of serializing `#page-content` and parsing it again.
+    content = response.css("#page-content")
+    if not content:
+        return None
+    root = copy.deepcopy(content[0].root)
+    root.tail = None
+
+    for element in root.xpath(CLEAN_CONTENT_XPATH):
+        element.drop_tree()
+
+    # Remove Empty Divs
+    if not "".join(root.xpath(VISIBLE_TEXT_XPATH)).strip():
+        return "<html><body></body></html>"
+    for element in root.xpath(".//div"):
+        if not "".join(element.xpath(VISIBLE_TEXT_XPATH)).strip():
+            element.drop_tree()
+
+    # Wrapped the same way BeautifulSoup's lxml builder wraps a fragment, which is what the dataset has always held.
+    return f"<html><body>{lxml.html.tostring(root, encoding='unicode')}</body></html>"
+
+
 def clean_content_soup(content_soup):
     # Remove Footer
     [x.extract() for x in content_soup.find_all("div", {"class": "footer-wikiwalk-nav"})]
@@ -0,0 +1,135 @@
+import hashlib
+import math
+import os
+import sqlite3
+import time
+from itertools import islice
+
+import lxml.html
+
+WORDS_PER_MINUTE = 200
+EXCERPT_LENGTH = 300
+
+# Bump when the derived fields change, so cached copies made the old way are ignored.
+TEXT_VERSION = 1
+
+TEXT_FIELDS = ("text", "word_count", "reading_time", "excerpt")
+
+# Elements that start a new line in the plain text.
+BLOCK_TAGS = ("blockquote", "br", "dd", "div", "dt", "hr", "li", "p", "pre", "table", "tr")
+BLOCK_TAGS += ("h1", "h2", "h3", "h4", "h5", "h6")
+
+
+def get_plain_text(html):
+    # Page text with one line per paragraph, list item and so on, and runs of whitespace collapsed.
+    if not html or not html.strip():
+        return ""
+    root = lxml.html.fromstring(html)
+    for element in list(root.iter("script", "style")):
+        element.drop_tree()
+    for element in root.iter(*BLOCK_TAGS):
+        element.tail = "\n" + (element.tail or "")
+    lines = (" ".join(line.split()) for line in root.text_content().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def get_excerpt(text, length=EXCERPT_LENGTH):
+    text = " ".join(text.split())
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(" ", 1)[0] + "..."
+
+
+def get_text_fields(html):
+    text = get_plain_text(html)
+    word_count = len(text.split())
+    return {
+        "text": text,
+        "word_count": word_count,
+        "reading_time": math.ceil(word_count / WORDS_PER_MINUTE),
+        "excerpt": get_excerpt(text),
+    }
+
+
+def add_text_fields(record):
+    # Pages whose content was already seen have these filled in from the `TextCache` before they get here.
+    if "word_count" not in record:
+        record.update(get_text_fields(record.get("raw_content")))
+    return record
+
+
+def get_content_hash(record):
+    return hashlib.sha1(f"{TEXT_VERSION}:{record.get('raw_content') or ''}".encode()).hexdigest()
+
+
+class TextCache:
+    # On disk cache of the fields from `get_text_fields`, keyed by a hash of the page content. Lookups and writes
+    # are done in batches around the worker pool, so unchanged pages skip the HTML parsing entirely.
+
+    def __init__(self, path, batch_size=500):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS texts (
+                hash TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                word_count INTEGER NOT NULL,
+                reading_time INTEGER NOT NULL,
+                excerpt TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+        self.known = set()
+        self.hits = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def iter_batches(self, records):
+        records = iter(records)
+        while batch := list(islice(records, self.batch_size)):
+            yield batch
+
+    def iter_cached(self, records):
+        # Fills in the text fields of every record whose content is in the cache.
+        for batch in self.iter_batches(records):
+            hashes = [get_content_hash(record) for record in batch]
+            placeholders = ", ".join("?" * len(hashes))
+            rows = self.connection.execute(
+                f"SELECT hash, {', '.join(TEXT_FIELDS)} FROM texts WHERE hash IN ({placeholders})", hashes
+            )
+            cached = {row[0]: dict(zip(TEXT_FIELDS, row[1:])) for row in rows}
+            self.known.update(cached)
+            for record, content_hash in zip(batch, hashes):
+                if content_hash in cached:
+                    record.update(cached[content_hash])
+                    self.hits += 1
+            yield from batch
+
+    def iter_stored(self, records):
+        # Saves the text fields of records whose content wasn't in the cache yet.
+        for batch in self.iter_batches(records):
+            now = time.time()
+            rows = {}
+            for record in batch:
+                content_hash = get_content_hash(record)
+                if content_hash not in self.known and "word_count" in record:
+                    rows[content_hash] = [content_hash, *(record[field] for field in TEXT_FIELDS), now]
+            if rows:
+                self.connection.executemany("INSERT OR REPLACE INTO texts VALUES (?, ?, ?, ?, ?, ?)", rows.values())
+                self.connection.commit()
+                self.known.update(rows)
+            yield from batch
@@ -0,0 +1,287 @@
+import asyncio
+import html
+import os
+import random
+import re
+import sqlite3
+import time
+
+import httpx
+from bs4 import BeautifulSoup
+
+MAIN_TOKEN = "123456"
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RATE_LIMIT = 8.0
+DEFAULT_ATTEMPTS = 5
+DEFAULT_BATCH_SIZE = 500
+
+# Statuses that mean "slow down and try again" rather than "this page is broken".
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def get_ajax_url(domain):
+    return f"https://{domain}/ajax-module-connector.php"
+
+
+def get_source_form(page_id):
+    return {
+        "wikidot_token7": MAIN_TOKEN,
+        "page_id": str(page_id),
+        "moduleName": "viewsource/ViewSourceModule",
+    }
+
+
+def parse_wiki_source(page_response):
+    soup = BeautifulSoup(page_response["body"], "lxml")
+    raw_source = "".join(str(x) for x in soup.find("div", {"class": "page-source"}).contents)
+    return re.sub(r"<br\s*?/?\s*?>", "\n", html.unescape(raw_source), flags=re.IGNORECASE)
+
+
+def get_revision(record):
+    # The newest change id in the raw crawl history, which is a dict keyed by change id.
+    history = record.get("history")
+    if not isinstance(history, dict) or not history:
+        return None
+    try:
+        return max(int(change_id) for change_id in history)
+    except ValueError:
+        return None
+
+
+class SourceCache:
+    # On disk cache of page sources keyed by `(domain, page_id, newest revision)`.
+    #
+    # Only one revision is kept per page- storing a newer revision replaces (and so evicts) the stale one, and a
+    # lookup for any revision other than the stored one is a miss.
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sources (
+                domain TEXT NOT NULL,
+                page_id TEXT NOT NULL,
+                revision INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (domain, page_id)
+            )
+            """
+        )
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+        self.seen = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def get(self, domain, page_id, revision):
+        self.seen.add((domain, str(page_id)))
+        if revision is None:
+            self.misses += 1
+            return None
+        row = self.connection.execute(
+            "SELECT source FROM sources WHERE domain = ? AND page_id = ? AND revision = ?",
+            (domain, str(page_id), revision),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put_many(self, entries):
+        # Takes `(domain, page_id, revision, source)` tuples. Failed lookups and unknown revisions are not stored.
+        now = time.time()
+        rows = [
+            (domain, str(page_id), revision, source, now)
+            for domain, page_id, revision, source in entries
+            if revision is not None and isinstance(source, str)
+        ]
+        if not rows:
+            return
+        self.connection.executemany("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)", rows)
+        self.connection.commit()
+
+    def put(self, domain, page_id, revision, source):
+        self.put_many([(domain, page_id, revision, source)])
+
+    def evict_unseen(self):
+        # Drops every page that has not been looked up through this cache, ie pages deleted from the wiki.
+        stale = [row for row in self.connection.execute("SELECT domain, page_id FROM sources") if row not in self.seen]
+        self.connection.executemany("DELETE FROM sources WHERE domain = ? AND page_id = ?", stale)
+        self.connection.commit()
+        return len(stale)
+
+
+class DomainRateLimiter:
+    # Spaces out request starts so that no domain sees more than `rate` requests per second.
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0
+        self.next_slot = {}
+        self.locks = {}
+
+    async def wait(self, domain):
+        if not self.interval:
+            return
+        if domain not in self.locks:
+            self.locks[domain] = asyncio.Lock()
+        async with self.locks[domain]:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(domain, now))
+            self.next_slot[domain] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class SourceFetcher:
+    # Bulk ViewSourceModule client.
+    #
+    # All requests share a single pooled `httpx.AsyncClient` and a single event loop, so the fetcher can be
+    # reused across batches (and content types) without reopening connections. Failed requests are retried
+    # with exponential backoff and jitter, honoring `Retry-After` when the wiki sends one.
+
+    def __init__(
+        self,
+        concurrency=DEFAULT_CONCURRENCY,
+        rate_limit=DEFAULT_RATE_LIMIT,
+        attempts=DEFAULT_ATTEMPTS,
+        backoff=1.0,
+        max_backoff=60.0,
+        timeout=30.0,
+        cache=None,
+        ajax_url=get_ajax_url,
+    ):
+        self.cache = cache
+        self.ajax_url = ajax_url
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.rate_limiter = DomainRateLimiter(rate_limit)
+        self.loop = asyncio.new_event_loop()
+        self.client = None
+        self.semaphore = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        if self.cache is not None:
+            print(f"Source cache: {self.cache.hits} hits, {self.cache.misses} misses.")
+            self.cache.close()
+        if self.client is not None:
+            self.loop.run_until_complete(self.client.aclose())
+            self.client = None
+        self.loop.close()
+
+    def get_client(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                cookies={"wikidot_token7": MAIN_TOKEN},
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency,
+                ),
+                timeout=self.timeout,
+            )
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self.client
+
+    def get_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        delay = min(self.backoff * (2**attempt), self.max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def fetch_source(self, page_id, domain):
+        client = self.get_client()
+        for attempt in range(self.attempts):
+            response = None
+            async with self.semaphore:
+                await self.rate_limiter.wait(domain)
+                try:
+                    response = await client.post(self.ajax_url(domain), data=get_source_form(page_id))
+                    response.raise_for_status()
+                    break
+                except httpx.HTTPStatusError:
+                    print(f"Failed to load source for {page_id}")
+                    if response.status_code not in RETRY_STATUSES:
+                        return False
+                except Exception:
+                    print(f"Failed to load source for {page_id}")
+            remaining = self.attempts - attempt - 1
+            if remaining <= 0:
+                return False
+            delay = self.get_delay(attempt, response)
+            print(f"Sleeping {delay:.1f}s before retry- {remaining} attempts remaining.")
+            await asyncio.sleep(delay)
+
+        try:
+            return parse_wiki_source(response.json())
+        except Exception:
+            print(f"Unable to pull body for wikisource from {page_id}")
+            return None
+
+    async def fetch_sources(self, pages):
+        tasks = [self.fetch_source(page_id, domain) for page_id, domain in pages]
+        return await asyncio.gather(*tasks)
+
+    def fetch_batch(self, pages):
+        # Takes a list of `(page_id, domain)` pairs and returns the sources in the same order.
+        if not pages:
+            return []
+        return self.loop.run_until_complete(self.fetch_sources(pages))
+
+    def iter_with_sources(self, records, batch_size=DEFAULT_BATCH_SIZE):
+        # Fills in `raw_source` for each record, fetching a full batch concurrently before yielding it.
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield from self.attach_sources(batch)
+                batch = []
+        if batch:
+            yield from self.attach_sources(batch)
+
+    def attach_sources(self, batch):
+        pending = []
+        for record in batch:
+            source = None
+            if self.cache is not None:
+                source = self.cache.get(record["domain"], record["page_id"], get_revision(record))
+            if source is None:
+                pending.append(record)
+            else:
+                record["raw_source"] = source
+
+        sources = self.fetch_batch([(record["page_id"], record["domain"]) for record in pending])
+        for record, source in zip(pending, sources):
+            record["raw_source"] = source
+
+        if self.cache is not None:
+            self.cache.put_many(
+                (record["domain"], record["page_id"], get_revision(record), record["raw_source"]) for record in pending
+            )
+        return batch
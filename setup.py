@@ -5,5 +5,6 @@ setup(
     version="1.0",
     packages=find_packages(),
     entry_points={"scrapy": ["settings = scp_crawler.settings"], "console_scripts": ["scp_pp = scp_crawler:postprocessing"]},
-    install_requires=["Scrapy", "beautifulsoup4", "tqdm", "httpx", "typer"],
+    install_requires=["Scrapy>=2.13", "beautifulsoup4", "tqdm", "httpx", "typer"],
+    extras_require={"parquet": ["pyarrow"]},
 )
@@ -0,0 +1,35 @@
+import sqlite3
+
+import pytest
+
+from scp_crawler.database import get_match_query
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("containment", '"containment"'),
+        ("scp-173", '"scp-173"'),
+        ("site-19 statue", '"site-19" "statue"'),
+        ("statue OR sculpture", '"statue" OR "sculpture"'),
+        ("keter AND NOT euclid", '"keter" AND NOT "euclid"'),
+        ("contain*", '"contain"*'),
+        ("scp-17*", '"scp-17"*'),
+        ('"site 19" OR keter', '"site 19" OR keter'),
+        ("(keter OR euclid) AND statue", "(keter OR euclid) AND statue"),
+    ],
+)
+def test_get_match_query(text, expected):
+    assert get_match_query(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [("scp-173", [1]), ("scp-17*", [1, 2]), ("site-19 OR statue", [1, 3])])
+def test_match_query_runs(text, expected):
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE VIRTUAL TABLE content USING fts5(text)")
+    db.executemany(
+        "INSERT INTO content (rowid, text) VALUES (?, ?)",
+        [(1, "scp-173 is a statue"), (2, "scp-1701 is not"), (3, "moved to site-19")],
+    )
+    rows = db.execute("SELECT rowid FROM content WHERE content MATCH ? ORDER BY rowid", (get_match_query(text),))
+    assert [row[0] for row in rows] == expected
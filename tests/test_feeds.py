@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from scp_crawler.feeds import CHANGES_FILE, HASHES_FILE, ShardedJsonWriter
+
+RECORDS = {f"SCP-{number:03d}": {"title": f"Item {number}", "raw_content": "x" * number} for number in range(1, 40)}
+
+
+def write_records(directory, keys, max_bytes=0, records=RECORDS):
+    with ShardedJsonWriter(directory, max_bytes=max_bytes) as writers:
+        index = writers.get_writer("index.json", fields=lambda key: {"content_file": writers.get_content_file(key)})
+        for key in keys:
+            writers.write(f"content_{int(key[4:]) % 3}.json", key, records[key])
+            index.write(key, {"title": records[key]["title"]})
+        writers.write_object("content_lookup.json", writers.get_locations())
+
+
+def read_lookup(directory, records=RECORDS):
+    with open(directory / "content_lookup.json") as fs:
+        lookup = json.load(fs)
+    with open(directory / "index.json") as fs:
+        index = json.load(fs)
+    assert sorted(lookup) == sorted(records)
+    for key, location in lookup.items():
+        with open(directory / location["file"], "rb") as fs:
+            fs.seek(location["offset"])
+            assert json.loads(fs.read(location["length"])) == records[key]
+        assert index[key]["content_file"] == location["file"]
+
+
+def read_changes(directory):
+    with open(directory / CHANGES_FILE) as fs:
+        return json.load(fs)
+
+
+@pytest.mark.parametrize("max_bytes", [0, 200])
+def test_reordered_rerun_keeps_files_and_lookup(tmp_path, max_bytes):
+    keys = list(RECORDS)
+    write_records(tmp_path, keys, max_bytes)
+    read_lookup(tmp_path)
+    files = {path.name: path.read_bytes() for path in tmp_path.glob("*.json") if path.name != CHANGES_FILE}
+
+    write_records(tmp_path, keys[::-1], max_bytes)
+    read_lookup(tmp_path)
+    assert read_changes(tmp_path) == {}
+    assert {path.name: path.read_bytes() for path in tmp_path.glob("*.json") if path.name != CHANGES_FILE} == files
+
+
+def test_parts_are_bounded(tmp_path):
+    write_records(tmp_path, list(RECORDS), max_bytes=200)
+    parts = list(tmp_path.glob("content_?_*.json"))
+    assert len(parts) > 3
+    for part in parts:
+        # Only a part holding a single record can go over the limit.
+        assert part.stat().st_size <= 200 or len(json.loads(part.read_text())) == 1
+
+
+def test_only_changed_files_are_replaced(tmp_path):
+    write_records(tmp_path, list(RECORDS))
+    records = {**RECORDS, "SCP-004": {"title": "Item 4", "raw_content": "changed"}}
+    write_records(tmp_path, list(records)[::-1], records=records)
+    read_lookup(tmp_path, records)
+    changes = read_changes(tmp_path)
+    assert sorted(changes) == ["content_1.json", "content_lookup.json"]
+    assert changes["content_1.json"] == {"added": [], "removed": [], "updated": ["SCP-004"]}
+
+
+def test_unused_files_are_removed(tmp_path):
+    write_records(tmp_path, list(RECORDS))
+    records = {key: record for key, record in RECORDS.items() if int(key[4:]) % 3}
+    write_records(tmp_path, list(records), records=records)
+    read_lookup(tmp_path, records)
+    assert not (tmp_path / "content_0.json").exists()
+    assert read_changes(tmp_path)["content_0.json"]["removed"] == sorted(set(RECORDS) - set(records))
+
+
+def test_failed_run_keeps_previous_files(tmp_path):
+    write_records(tmp_path, list(RECORDS))
+    files = {path.name: path.read_bytes() for path in tmp_path.glob("*.json")}
+    with pytest.raises(RuntimeError):
+        with ShardedJsonWriter(tmp_path) as writers:
+            writers.write("content_0.json", "SCP-003", {"title": "changed"})
+            raise RuntimeError
+    assert {path.name: path.read_bytes() for path in tmp_path.glob("*.json")} == files
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_files_from_an_older_layout_are_replaced(tmp_path):
+    write_records(tmp_path, list(RECORDS))
+    with open(tmp_path / HASHES_FILE) as fs:
+        hashes = json.load(fs)["files"]
+    # Hashes saved before they had a version, next to a shard written in another order.
+    with open(tmp_path / HASHES_FILE, "w") as fs:
+        json.dump(hashes, fs)
+    shard = json.loads((tmp_path / "content_0.json").read_text())
+    (tmp_path / "content_0.json").write_text(json.dumps(dict(reversed(shard.items()))))
+
+    write_records(tmp_path, list(RECORDS))
+    read_lookup(tmp_path)